@@ -0,0 +1,88 @@
+# Checks applications for breaking changes on the controller, without starting a new process per application.
+#
+# Usage:
+#   Check all applications that will run at once (done by the playbook's pre_tasks):
+#     - breaking_changes:
+#         applications: [sonarr, radarr]
+#       register: _breaking_changes_batch
+#       run_once: true
+#   Then check each application, which only looks up its result from `breaking_changes_results`:
+#     - breaking_changes:
+#         application: sonarr
+#   Applications that weren't in the batch (e.g. personal applications) are checked on their own.
+
+import importlib.util
+import os
+
+from ansible.plugins.action import ActionBase
+
+BREAKING_CHANGES_SCRIPT_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    "../roles/breaking_changes/files/breaking_changes.py",
+)
+
+FAIL_MSG = """Breaking Changes Detected!
+---
+Breaking changes detected for {application}!
+Please review the documentation for this application:
+https://dylancyclone.github.io/ansible-homelab-orchestration/applications/{application}.
+When resolved, delete the corresponding `BREAKING_CHANGE_{application}.txt` file in the state directory and rerun the playbook.
+To temporarily ignore this application, add `--skip-tags="{application}"` to your ansible-playbook command.
+This will let you deploy other applications while you address the breaking changes.
+---"""
+
+
+def load_breaking_changes_script():
+    spec = importlib.util.spec_from_file_location(
+        "homelab_breaking_changes", BREAKING_CHANGES_SCRIPT_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("application", "applications"))
+    _requires_connection = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        _, args = self.validate_argument_spec(
+            argument_spec=dict(
+                application=dict(type="str"),
+                applications=dict(type="list", elements="str"),
+            ),
+            mutually_exclusive=[("application", "applications")],
+            required_one_of=[("application", "applications")],
+        )
+        result["changed"] = False
+
+        if args["applications"] is not None:
+            breaking_changes = load_breaking_changes_script().check_applications(
+                args["applications"]
+            )
+            result["applications"] = {
+                application: dict(breaking=breaking)
+                for application, breaking in breaking_changes.items()
+            }
+            return result
+
+        application = args["application"]
+        checked_applications = self._templar.template(task_vars.get("breaking_changes_results", {}))
+        if application in checked_applications:
+            breaking = checked_applications[application]["breaking"]
+        else:
+            # Not in the batch (e.g. a personal application, whose play only gets the results of the main play),
+            # check it on its own
+            breaking = load_breaking_changes_script().check_applications([application])[
+                application
+            ]
+
+        result["breaking"] = breaking
+        if breaking:
+            result["failed"] = True
+            result["msg"] = FAIL_MSG.format(application=application)
+        return result
@@ -0,0 +1,111 @@
+# Runs community.docker.docker_container, unless the container is already running exactly as configured
+# (or, when removing it, is already gone).
+#
+# The options of each container are hashed and stored in a label on the container. When the
+# `docker_containers` snapshot taken by the playbook's pre_tasks shows a running container with the
+# same hash, and the container runs the image currently tagged locally, the module isn't run at all,
+# which saves inspecting and comparing every container on every run.
+#
+# Usage (takes the same options as community.docker.docker_container):
+#   - name: Sonarr Docker Container
+#     cached_docker_container:
+#       name: "{{ sonarr_container_name }}"
+#       image: "{{ sonarr_image_name }}:{{ sonarr_image_version }}"
+#       ...
+#   Containers are removed the same way, which is skipped when the snapshot has no such container:
+#   - name: Stop Sonarr
+#     cached_docker_container:
+#       name: "{{ sonarr_container_name }}"
+#       state: absent
+#
+# Set `docker_skip_unchanged_containers: false` to always run the module.
+#
+# With `async` and `poll: 0` the module runs in the background, and its job is added to the
+# `docker_container_jobs` fact, so the playbook can wait for every container that was started or removed at once.
+
+import hashlib
+import json
+
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+
+DOCKER_CONTAINER_MODULE = "community.docker.docker_container"
+CONFIG_HASH_LABEL = "ansible_homelab_orchestration.config_hash"
+# Options that only change what happens during this run, not how the container is configured
+RUN_OPTIONS = ("pull", "recreate", "restart")
+
+
+def get_config_hash(module_args):
+    config = {
+        option: value for option, value in module_args.items() if option not in RUN_OPTIONS
+    }
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def is_unchanged(module_args, config_hash, container, image_id):
+    # Whether running the module would leave the container as it is
+    if module_args.get("state") == "absent":
+        # Nothing to remove
+        return container is None
+    if container is None or image_id is None:
+        return False
+    if module_args.get("state", "started") != "started" or container.get("State") != "running":
+        return False
+    if boolean(module_args.get("recreate", False), strict=False) or boolean(
+        module_args.get("restart", False), strict=False
+    ):
+        return False
+    # The module would check the registry for a newer image first
+    if str(module_args.get("pull", "missing")).lower() in ("always", "true", "yes"):
+        return False
+    return (
+        (container.get("Labels") or {}).get(CONFIG_HASH_LABEL) == config_hash
+        and container.get("ImageID") == image_id
+    )
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _supports_async = True
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        module_args = dict(self._task.args)
+        config_hash = get_config_hash(module_args)
+        module_args["labels"] = dict(module_args.get("labels") or {})
+        module_args["labels"][CONFIG_HASH_LABEL] = config_hash
+
+        if boolean(task_vars.get("docker_skip_unchanged_containers", True), strict=False):
+            containers = task_vars.get("docker_containers", {})
+            images = task_vars.get("docker_images", {})
+            if is_unchanged(
+                module_args,
+                config_hash,
+                containers.get(module_args.get("name")),
+                images.get(module_args.get("image")),
+            ):
+                result["changed"] = False
+                result["msg"] = "Container is already running with this configuration"
+                return result
+
+        wrap_async = self._task.async_val and not self._connection.has_native_async
+        result.update(
+            self._execute_module(
+                module_name=DOCKER_CONTAINER_MODULE,
+                module_args=module_args,
+                task_vars=task_vars,
+                wrap_async=wrap_async,
+            )
+        )
+        if not wrap_async:
+            self._remove_tmp_path(self._connection._shell.tmpdir)
+        elif "ansible_job_id" in result:
+            result["ansible_facts"] = {
+                "docker_container_jobs": task_vars.get("docker_container_jobs", [])
+                + [{"jid": result["ansible_job_id"], "name": module_args.get("name")}]
+            }
+        return result
@@ -0,0 +1,151 @@
+# Warns, or fails, when the memory limits of the containers of the enabled applications add up to more than
+# a percentage of the host's memory, before any container is started.
+# Containers and their limits come from the role model shared with scripts/memory_budget.py, which runs the
+# same check for an inventory without running the playbook. The model is only read from its cache, never written.
+#
+# Usage:
+#   - check_memory_budget:
+#       applications: [sonarr, radarr] # Applications that are started
+#       host_memory_mb: "{{ ansible_facts.memtotal_mb | default(0) }}"
+#       max_percent: 100
+#       enforce: false # Fail instead of warning
+#   # result.memory holds the bytes the limits add up to, result.applications the bytes of each application
+#
+# If host_memory_mb isn't known, only MemTotal is read from the host's /proc/meminfo (instead of gathering every
+# hardware fact), and returned as the memtotal_mb fact so it's cached with the other facts.
+
+import base64
+import importlib.util
+import os
+from collections import ChainMap
+
+from ansible.errors import AnsibleError
+from ansible.plugins.action import ActionBase
+
+try:
+    from ansible.template import trust_as_template
+except ImportError:
+    # Before ansible-core 2.19 every string is templated, trusted or not
+    def trust_as_template(value):
+        return value
+
+SCRIPTS_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../scripts")
+
+
+def load_script(name):
+    # Loaded under a name of its own, so nothing is added to sys.path and no other module called the same is replaced
+    spec = importlib.util.spec_from_file_location(
+        f"homelab_{name}", f"{SCRIPTS_DIRECTORY}/{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_memtotal_mb(meminfo):
+    # MemTotal of /proc/meminfo, e.g. `MemTotal:       16318480 kB`, in MB
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) // 1024
+    return 0
+
+
+def trust_templates(value):
+    # The role model is read from role files by scripts/role_model.py, its templates are trusted like Ansible trusts roles
+    if isinstance(value, str):
+        return trust_as_template(value)
+    if isinstance(value, dict):
+        return {key: trust_templates(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [trust_templates(item) for item in value]
+    return value
+
+
+def render(templar, value):
+    # Value of a container parameter, or None if it uses something that isn't known yet
+    try:
+        return templar.template(trust_templates(value))
+    except AnsibleError:
+        return None
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("applications", "host_memory_mb", "max_percent", "enforce"))
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        _, args = self.validate_argument_spec(
+            argument_spec=dict(
+                applications=dict(type="list", elements="str", required=True),
+                host_memory_mb=dict(type="int", default=0),
+                max_percent=dict(type="int", default=100),
+                enforce=dict(type="bool", default=False),
+            ),
+        )
+        memory_budget = load_script("memory_budget")
+        role_models = load_script("role_model").load_role_models(args["applications"], save=False)
+
+        application_memory = dict()
+        unknown_containers = []
+        for application, model in role_models.items():
+            templar = self._templar.copy_with_new_env(
+                available_variables=ChainMap(task_vars, trust_templates(model.defaults or {}))
+            )
+            memory = 0
+            for container, container_memory, _ in memory_budget.get_container_limits(
+                model, lambda value: render(templar, value)
+            ):
+                if container_memory is None:
+                    unknown_containers.append(container)
+                memory += container_memory or 0
+            application_memory[application] = memory
+        total_memory = sum(application_memory.values())
+
+        result["changed"] = False
+        result["memory"] = total_memory
+        result["applications"] = application_memory
+        if unknown_containers:
+            result["warnings"] = [
+                f"Memory limit of {', '.join(unknown_containers)} couldn't be worked out, they aren't counted"
+            ]
+
+        host_memory_mb = args["host_memory_mb"]
+        if host_memory_mb <= 0:
+            host_memory_mb = self._read_memtotal_mb(task_vars)
+            if host_memory_mb > 0:
+                result["ansible_facts"] = {"memtotal_mb": host_memory_mb}
+        if host_memory_mb <= 0:
+            result["msg"] = f"Memory limits add up to {memory_budget.format_memory(total_memory)}, the host's memory is unknown"
+            return result
+
+        host_memory = host_memory_mb * memory_budget.MEMORY_UNITS["m"]
+        result["msg"] = (
+            f"Memory limits of {len(application_memory)} applications add up to {memory_budget.format_memory(total_memory)}, "
+            f"{total_memory * 100 / host_memory:.0f}% of the host's {memory_budget.format_memory(host_memory)}"
+        )
+        if total_memory > host_memory * args["max_percent"] // 100:
+            largest = sorted(application_memory, key=application_memory.get, reverse=True)[:5]
+            message = (
+                f"{result['msg']}, more than memory_budget_max_percent ({args['max_percent']}%). "
+                f"Largest: {', '.join(f'{application} ({memory_budget.format_memory(application_memory[application])})' for application in largest)}"
+            )
+            if args["enforce"]:
+                result["failed"] = True
+                result["msg"] = message
+            else:
+                result.setdefault("warnings", []).append(message)
+        return result
+
+    def _read_memtotal_mb(self, task_vars):
+        # 0 if the host has no /proc/meminfo
+        meminfo = self._execute_module(
+            module_name="ansible.builtin.slurp",
+            module_args=dict(src="/proc/meminfo"),
+            task_vars=task_vars,
+        )
+        if meminfo.get("failed") or "content" not in meminfo:
+            return 0
+        return parse_memtotal_mb(base64.b64decode(meminfo["content"]).decode("utf-8", "replace"))
@@ -0,0 +1,33 @@
+# Runs the create_directories module, unless the playbook's pre_tasks already created these directories
+# along with the directories of every other application.
+#
+# Usage (takes the same options as the create_directories module):
+#   - name: Create Sonarr Directories
+#     create_directories:
+#       directories: "{{ sonarr_directories }}"
+
+from ansible.plugins.action import ActionBase
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        directories = self._task.args.get("directories") or []
+        created_directories = task_vars.get("created_directories", [])
+        if all(directory in created_directories for directory in directories):
+            result["changed"] = False
+            result["msg"] = "Directories were already created before any application was set up"
+            return result
+
+        result.update(
+            self._execute_module(
+                module_name="create_directories",
+                module_args=self._task.args,
+                task_vars=task_vars,
+            )
+        )
+        return result
@@ -0,0 +1,118 @@
+# Keeps track of when each host last pulled each image and the digest it resolved to, so images
+# are only pulled from their registry again once they're older than a configurable age.
+#
+# Usage:
+#   Find the images that are due to be pulled:
+#     - docker_image_cache:
+#         images: [linuxserver/sonarr:latest, linuxserver/radarr:latest]
+#         max_age_hours: 24 # 0 means every image is always due
+#         force: false # Treat every image as due
+#       register: _image_cache
+#     # _image_cache.images_to_pull holds the images that are due
+#   Then record the images that were pulled, one `<image> <digest>` line each (e.g. from `docker pull` output),
+#   anything after the digest is ignored:
+#     - docker_image_cache:
+#         pulled: ["linuxserver/sonarr:latest sha256:..."]
+
+import os
+import sqlite3
+import time
+
+from ansible.plugins.action import ActionBase
+
+STATE_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "../state"
+)
+STATE_DATABASE_PATH = f"{STATE_DIRECTORY}/application_state.db"
+# How long to wait for another host to release the state
+STATE_LOCK_TIMEOUT_SECONDS = 120
+
+
+def open_state(database_path=STATE_DATABASE_PATH):
+    # The returned connection holds the state's write lock until it is committed or closed,
+    # so hosts recording their pulls at the same time take turns
+    connection = sqlite3.connect(
+        database_path, timeout=STATE_LOCK_TIMEOUT_SECONDS, isolation_level=None
+    )
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS image_digests (host TEXT NOT NULL, image TEXT NOT NULL, digest TEXT NOT NULL, pulled_at REAL NOT NULL, PRIMARY KEY (host, image))"
+    )
+    return connection
+
+
+def find_images_to_pull(connection, host, images, max_age_hours, force):
+    if force or max_age_hours <= 0:
+        return list(images)
+    pulled_after = time.time() - max_age_hours * 60 * 60
+    fresh_images = {
+        image
+        for (image,) in connection.execute(
+            "SELECT image FROM image_digests WHERE host = ? AND pulled_at > ?",
+            (host, pulled_after),
+        )
+    }
+    return [image for image in images if image not in fresh_images]
+
+
+def record_pulled_images(connection, host, pulled):
+    # Returns the images that resolved to a different digest than last time
+    pulled_at = time.time()
+    changed_images = []
+    for line in pulled:
+        fields = line.strip().split(" ")
+        image = fields[0]
+        digest = fields[1] if len(fields) > 1 else ""
+        if not image:
+            continue
+        row = connection.execute(
+            "SELECT digest FROM image_digests WHERE host = ? AND image = ?",
+            (host, image),
+        ).fetchone()
+        if row is None or row[0] != digest:
+            changed_images.append(image)
+        connection.execute(
+            "INSERT OR REPLACE INTO image_digests (host, image, digest, pulled_at) VALUES (?, ?, ?, ?)",
+            (host, image, digest, pulled_at),
+        )
+    return changed_images
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("images", "max_age_hours", "force", "pulled"))
+    _requires_connection = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        _, args = self.validate_argument_spec(
+            argument_spec=dict(
+                images=dict(type="list", elements="str"),
+                max_age_hours=dict(type="float", default=0),
+                force=dict(type="bool", default=False),
+                pulled=dict(type="list", elements="str"),
+            ),
+            mutually_exclusive=[("images", "pulled")],
+            required_one_of=[("images", "pulled")],
+        )
+        # Every host has its own images, even though the state is kept on the controller
+        host = task_vars["inventory_hostname"]
+        result["changed"] = False
+
+        connection = open_state()
+        try:
+            if args["images"] is not None:
+                result["images_to_pull"] = find_images_to_pull(
+                    connection, host, args["images"], args["max_age_hours"], args["force"]
+                )
+            else:
+                result["changed_images"] = record_pulled_images(
+                    connection, host, args["pulled"]
+                )
+                result["changed"] = bool(result["changed_images"])
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return result
@@ -0,0 +1,148 @@
+# Finds the applications that need to run on a host, so roles of every other application are never loaded.
+# Applications are given in groups, each group only depending on the groups before it. Groups are split
+# into batches of at most batch_size applications, whose containers can be started at the same time.
+#
+# An application needs to run if it's enabled, or if any of its containers are still running (so it can
+# be stopped). Applications excluded with `--tags` or `--skip-tags` are left out.
+# Role defaults aren't loaded until a role is included, so each role's defaults file is read here,
+# with the host's variables taking precedence over them just like they would once the role is included.
+#
+# Usage:
+#   - find_applications:
+#       application_groups:
+#         - name: Applications
+#           applications: [sonarr, radarr]
+#       running_containers: "{{ running_containers }}"
+#       batch_size: 8 # 0 keeps each group in one batch
+#     register: _applications
+#   # _applications.applications holds the applications to run, in the same order
+#   # _applications.applications_to_start holds the ones that are enabled, the others only run to be stopped
+#   # _applications.application_batches holds them split by group and batch, e.g. [{name: Applications, applications: [sonarr, radarr]}]
+#   # The docker_container_jobs fact (see cached_docker_container) is cleared, since facts of previous runs are cached
+#   # _applications.container_images holds the images of the applications that are enabled
+#   # _applications.directories holds the directories of the applications that are enabled
+#   # _applications.gather_subset holds the fact subsets (see ansible.builtin.setup) the applications that are enabled use
+
+import os
+from collections import ChainMap
+
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action import ActionBase
+
+try:
+    from ansible.template import trust_as_template
+except ImportError:
+    # Before ansible-core 2.19 every string is templated, trusted or not
+    def trust_as_template(value):
+        return value
+
+ROLES_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../roles")
+
+
+def trust_templates(value):
+    # Role files read here instead of by Ansible, with their templates trusted like Ansible trusts role defaults
+    if isinstance(value, str):
+        return trust_as_template(value)
+    if isinstance(value, dict):
+        return {key: trust_templates(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [trust_templates(item) for item in value]
+    return value
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+    _VALID_ARGS = frozenset(("application_groups", "running_containers", "batch_size"))
+    _requires_connection = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        _, args = self.validate_argument_spec(
+            argument_spec=dict(
+                application_groups=dict(
+                    type="list",
+                    elements="dict",
+                    required=True,
+                    options=dict(
+                        name=dict(type="str", required=True),
+                        applications=dict(type="list", elements="str", required=True),
+                    ),
+                ),
+                running_containers=dict(type="list", elements="str", default=[]),
+                batch_size=dict(type="int", default=0),
+            ),
+        )
+        run_tags = task_vars.get("ansible_run_tags", ["all"])
+        skip_tags = task_vars.get("ansible_skip_tags", [])
+        running_containers = set(args["running_containers"])
+
+        applications = []
+        applications_to_start = []
+        application_batches = []
+        container_images = []
+        directories = []
+        gather_subset = set()
+        for application_group in args["application_groups"]:
+            group_applications = []
+            for application in application_group["applications"]:
+                if ("all" not in run_tags and application not in run_tags) or application in skip_tags:
+                    continue
+                enabled, container_names, images, application_directories, application_gather_subset = (
+                    self._load_application(application, task_vars)
+                )
+                if enabled or running_containers.intersection(container_names):
+                    group_applications.append(application)
+                if enabled:
+                    applications_to_start.append(application)
+                    container_images.extend(images)
+                    directories.extend(application_directories)
+                    gather_subset.update(application_gather_subset)
+            applications.extend(group_applications)
+            batch_size = args["batch_size"] if args["batch_size"] > 0 else len(group_applications)
+            for start in range(0, len(group_applications), batch_size or 1):
+                application_batches.append(
+                    {
+                        "name": application_group["name"],
+                        "applications": group_applications[start : start + batch_size],
+                    }
+                )
+
+        result["changed"] = False
+        result["applications"] = applications
+        result["applications_to_start"] = applications_to_start
+        result["application_batches"] = application_batches
+        result["ansible_facts"] = {"docker_container_jobs": []}
+        result["container_images"] = container_images
+        result["directories"] = directories
+        result["gather_subset"] = sorted(gather_subset)
+        return result
+
+    def _load_application(self, application, task_vars):
+        # Whether the application is enabled, its container names, and its images, directories and fact subsets if it's enabled
+        defaults = trust_templates(self._loader.load_from_file(
+            f"{ROLES_DIRECTORY}/{application}/defaults/main.yml"
+        ) or {})
+        templar = self._templar.copy_with_new_env(available_variables=ChainMap(task_vars, defaults))
+        enabled = boolean(
+            templar.template(trust_as_template(f"{{{{ {application}_enabled | default(false) }}}}")),
+            strict=False,
+        )
+        container_names = templar.template(
+            trust_as_template(f"{{{{ {application}_container_names | default([]) }}}}")
+        )
+        container_images = []
+        directories = []
+        gather_subset = []
+        if enabled:
+            container_images = templar.template(
+                trust_as_template(f"{{{{ {application}_container_images | default([]) }}}}")
+            )
+            directories = templar.template(
+                trust_as_template(f"{{{{ {application}_directories | default([]) }}}}")
+            )
+            gather_subset = templar.template(
+                trust_as_template(f"{{{{ {application}_gather_subset | default([]) }}}}")
+            )
+        return enabled, container_names, container_images, directories, gather_subset
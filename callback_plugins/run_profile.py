@@ -0,0 +1,192 @@
+# Records how long each task of a playbook run took, and which role and kind of work it belongs to,
+# so slow roles and regressions between runs can be found.
+#
+# Enabled in ansible.cfg. At the end of each run it:
+#   - Shows the slowest tasks and roles, and the time spent on each kind of work
+#   - Writes every task of the run to state/run_profile.json
+#   - Adds a row for the run to state/run_profile_history.csv, and a row per role to state/run_profile_roles.csv,
+#     to compare runs over time
+#
+# Times are wall clock times from the start of a task until the start of the next one, across all hosts.
+
+import csv
+import datetime
+import json
+import os
+import time
+
+from ansible.playbook.block import Block
+from ansible.plugins.callback import CallbackBase
+
+STATE_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "../state"
+)
+PROFILE_PATH = f"{STATE_DIRECTORY}/run_profile.json"
+HISTORY_PATH = f"{STATE_DIRECTORY}/run_profile_history.csv"
+ROLE_HISTORY_PATH = f"{STATE_DIRECTORY}/run_profile_roles.csv"
+# How many tasks and roles to show at the end of a run
+SUMMARY_SIZE = 10
+
+# Kinds of work, by the action a task runs
+CATEGORIES_BY_ACTION = {
+    "breaking_changes": "breaking_changes",
+    "create_directories": "directories",
+    "ansible.builtin.file": "directories",
+    "docker_image_cache": "image_pulls",
+    "cached_docker_container": "containers",
+    "community.docker.docker_container": "containers",
+    # Waiting for containers started in the background
+    "ansible.builtin.async_status": "containers",
+}
+# Kinds of work, by the name of the playbook block a task is in
+CATEGORIES_BY_BLOCK = {
+    "Check for breaking changes": "breaking_changes",
+    "Create application directories": "directories",
+    "Pull application images": "image_pulls",
+}
+CATEGORIES = ("breaking_changes", "directories", "image_pulls", "containers", "other")
+
+
+def get_task_category(task):
+    category = CATEGORIES_BY_ACTION.get(task.action)
+    parent = task._parent
+    while category is None and parent is not None:
+        if isinstance(parent, Block):
+            category = CATEGORIES_BY_BLOCK.get(parent.name)
+        parent = parent._parent
+    return category or "other"
+
+
+def add_to_total(totals, key, amount):
+    totals[key] = totals.get(key, 0) + amount
+
+
+def append_csv_rows(file_path, header, rows):
+    new_file = not os.path.exists(file_path)
+    with open(file_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(header)
+        writer.writerows(rows)
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "run_profile"
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self.playbook = ""
+        self.started_at = None
+        self.start_time = None
+        self.tasks = []
+        self.current_task = None
+
+    def _end_current_task(self):
+        if self.current_task is not None:
+            self.current_task["duration"] = (
+                time.time() - self.start_time - self.current_task["started"]
+            )
+            self.tasks.append(self.current_task)
+            self.current_task = None
+
+    def _start_task(self, task):
+        self._end_current_task()
+        self.current_task = {
+            "name": task.get_name(),
+            "role": task._role.get_name() if task._role else "",
+            "action": task.action,
+            "category": get_task_category(task),
+            # Seconds since the run started
+            "started": time.time() - self.start_time,
+        }
+
+    def v2_playbook_on_start(self, playbook):
+        self.playbook = os.path.basename(playbook._file_name)
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.start_time = time.time()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start_task(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start_task(task)
+
+    def v2_playbook_on_stats(self, stats):
+        self._end_current_task()
+        duration = time.time() - self.start_time
+        role_durations = dict()
+        role_task_counts = dict()
+        category_durations = {category: 0 for category in CATEGORIES}
+        for task in self.tasks:
+            add_to_total(role_durations, task["role"], task["duration"])
+            add_to_total(role_task_counts, task["role"], 1)
+            add_to_total(category_durations, task["category"], task["duration"])
+
+        self._display_summary(duration, role_durations, category_durations)
+
+        if not os.path.isdir(STATE_DIRECTORY):
+            return
+        with open(PROFILE_PATH, "w") as f:
+            json.dump(
+                {
+                    "playbook": self.playbook,
+                    "started_at": self.started_at,
+                    "start_time": self.start_time,
+                    "duration": duration,
+                    "categories": category_durations,
+                    "roles": role_durations,
+                    "tasks": self.tasks,
+                },
+                f,
+                indent=2,
+            )
+        append_csv_rows(
+            HISTORY_PATH,
+            ["started_at", "playbook", "duration", "tasks"] + list(CATEGORIES),
+            [
+                [self.started_at, self.playbook, round(duration, 3), len(self.tasks)]
+                + [round(category_durations[category], 3) for category in CATEGORIES]
+            ],
+        )
+        append_csv_rows(
+            ROLE_HISTORY_PATH,
+            ["started_at", "playbook", "role", "duration", "tasks"],
+            [
+                [
+                    self.started_at,
+                    self.playbook,
+                    role or "(playbook)",
+                    round(role_duration, 3),
+                    role_task_counts[role],
+                ]
+                for role, role_duration in sorted(role_durations.items())
+            ],
+        )
+
+    def _display_summary(self, duration, role_durations, category_durations):
+        self._display.banner("RUN PROFILE")
+        self._display.display(f"Total: {duration:.2f}s")
+
+        self._display.display("")
+        self._display.display("Time by kind of work:")
+        for category, category_duration in sorted(
+            category_durations.items(), key=lambda item: item[1], reverse=True
+        ):
+            self._display.display(f"  {category:<20} {category_duration:8.2f}s")
+
+        self._display.display("")
+        self._display.display(f"Slowest {SUMMARY_SIZE} roles:")
+        for role, role_duration in sorted(
+            role_durations.items(), key=lambda item: item[1], reverse=True
+        )[:SUMMARY_SIZE]:
+            self._display.display(f"  {role or '(playbook)':<40} {role_duration:8.2f}s")
+
+        self._display.display("")
+        self._display.display(f"Slowest {SUMMARY_SIZE} tasks:")
+        for task in sorted(self.tasks, key=lambda task: task["duration"], reverse=True)[
+            :SUMMARY_SIZE
+        ]:
+            self._display.display(f"  {task['name'][:60]:<60} {task['duration']:8.2f}s")
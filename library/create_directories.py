@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# Creates any number of directories in a single module run, instead of one ansible.builtin.file run each.
+#
+# Usage:
+#   - create_directories:
+#       directories:
+#         - /srv/sonarr/config
+#         # Owner, group and mode are optional, and only changed when given.
+#         # Like ansible.builtin.file, they're also given to the parent directories that are created
+#         - path: /srv/mumble
+#           owner: 1000
+#           group: 1000
+#           mode: "0775"
+#     register: _directories
+#   # _directories.created holds the directories that didn't exist yet
+
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+
+
+def get_directory_arguments(directory):
+    # Directories are either a path, or a mapping of path, owner, group and mode
+    if not isinstance(directory, dict):
+        directory = {"path": directory}
+    return {
+        "path": os.path.expanduser(str(directory["path"])),
+        "owner": directory.get("owner"),
+        "group": directory.get("group"),
+        "mode": directory.get("mode"),
+    }
+
+
+def get_missing_directories(path):
+    # Directories that have to be created for path to exist, from the outermost one
+    missing_directories = []
+    path = os.path.normpath(path)
+    while not os.path.exists(path):
+        missing_directories.insert(0, path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return missing_directories
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            directories=dict(type="list", elements="raw", required=True),
+        ),
+        supports_check_mode=True,
+    )
+
+    changed = False
+    created = []
+    for directory in module.params["directories"]:
+        directory_arguments = get_directory_arguments(directory)
+        path = directory_arguments["path"]
+        if os.path.exists(path) and not os.path.isdir(path):
+            module.fail_json(msg=f"{path} already exists and is not a directory")
+        # Like ansible.builtin.file, the owner, group and mode are given to every directory that's created,
+        # not only to the last one, and to the last one when it already exists
+        missing_directories = get_missing_directories(path)
+        created.extend(missing_directories)
+        changed = changed or len(missing_directories) > 0
+        if module.check_mode and missing_directories:
+            continue
+        for missing_directory in missing_directories:
+            try:
+                os.mkdir(missing_directory)
+            except OSError as e:
+                module.fail_json(msg=f"Could not create {missing_directory}: {e}")
+            file_arguments = module.load_file_common_arguments(dict(directory_arguments, path=missing_directory))
+            module.set_fs_attributes_if_different(file_arguments, True)
+        if not missing_directories:
+            file_arguments = module.load_file_common_arguments(directory_arguments)
+            changed = module.set_fs_attributes_if_different(file_arguments, changed)
+
+    module.exit_json(changed=changed, created=created)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,98 +1,326 @@
+import json
 import os
+import sqlite3
 import subprocess
 import sys
-import fileinput
 import re
+import tempfile
 
-if len(sys.argv) != 2:
-    print("Usage: python breaking_changes.py <application_name>")
-    sys.exit(1)
-
-# Change working directory to the script's directory
-dirname = os.path.dirname(os.path.realpath(__file__))
-os.chdir(dirname)
-
-application_to_check = sys.argv[1]
-current_git_commit_hash = (
-    subprocess.check_output(["git", "rev-parse", "HEAD"]).decode("ascii").strip()
-)
-
-# Check if we're already marked as having a breaking change
-breaking_change_file_path = f"../../../state/BREAKING_CHANGE_{application_to_check}.txt"
-if os.path.exists(breaking_change_file_path):
-    sys.exit(1)
-
-# Open state file
-state_file_path = "../../../state/application_last_run_hashes.csv"
-if not os.path.exists(state_file_path):
-    # Create the state file if it doesn't exist
-    with open(state_file_path, "w") as f:
-        pass
-
-for line in fileinput.input(state_file_path, inplace=True):
-    app, last_hash = line.strip().split(",")
-    if app == application_to_check:
-        if last_hash != current_git_commit_hash:
-            commit_messages_since_last_run = ""
-            try:
-                commit_messages_since_last_run = (
-                    subprocess.check_output(
-                        [
-                            "git",
-                            "log",
-                            "--pretty=format:%s %H",  # Commit message and hash
-                            f"{last_hash}..{current_git_commit_hash}",
-                        ]
-                    )
-                    .decode("ascii")
-                    .strip()
-                )
-            except:
-                # If git log fails (e.g., last_hash not found), assume the user knows what they're doing
-                commit_messages_since_last_run = ""
-
-            # Regardless of whether a breaking change was found, update the state to latest commit hash
-            print(f"{application_to_check},{current_git_commit_hash}")
-
-            # Check for breaking change pattern in commit messages
-            breaking_change_regex = (
-                r"^([a-z]+\("
-                + re.escape(application_to_check)
-                + r"\)!:.+) ([a-z0-9]{40})$"
-            )
-            regex_search = re.findall(
-                breaking_change_regex,
-                commit_messages_since_last_run,
-                re.IGNORECASE | re.MULTILINE,
+REPOSITORY_URL = "https://github.com/Dylancyclone/ansible-homelab-orchestration"
+DOCS_URL = "https://dylancyclone.github.io/ansible-homelab-orchestration"
+
+# Paths are relative to this script so it can also be imported (e.g. by the breaking_changes action plugin)
+SCRIPT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+STATE_DIRECTORY = os.path.join(SCRIPT_DIRECTORY, "../../../state")
+STATE_DATABASE_PATH = f"{STATE_DIRECTORY}/application_state.db"
+LEGACY_STATE_FILE_PATH = f"{STATE_DIRECTORY}/application_last_run_hashes.csv"
+# How long to wait for another check (e.g. against another host) to release the state
+STATE_LOCK_TIMEOUT_SECONDS = 120
+COMMIT_INDEX_FILE_PATH = f"{STATE_DIRECTORY}/breaking_changes_index.json"
+COMMIT_INDEX_VERSION = 1
+
+# Conventional commit subject with a breaking change marker, e.g. `feat(sonarr)!: ...`
+BREAKING_CHANGE_REGEX = re.compile(r"^[a-z]+\(([^)]+)\)!:.+$", re.IGNORECASE)
+
+
+def get_breaking_change_file_path(application):
+    return f"{STATE_DIRECTORY}/BREAKING_CHANGE_{application}.txt"
+
+
+def write_file_atomically(file_path, content):
+    # Write to a temporary file next to the target and swap it in, so readers never see a partial file
+    directory = os.path.dirname(file_path) or "."
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
+        f.write(content)
+    os.replace(f.name, file_path)
+
+
+def open_state():
+    # The state database holds the git commit hash each application was last run at.
+    # The returned connection holds the state's write lock until it is committed or closed, so checks
+    # running at the same time (e.g. with `strategy: free` or against several hosts) take turns.
+    connection = sqlite3.connect(
+        STATE_DATABASE_PATH, timeout=STATE_LOCK_TIMEOUT_SECONDS, isolation_level=None
+    )
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS last_run_hashes (application TEXT PRIMARY KEY, commit_hash TEXT NOT NULL)"
+    )
+    return connection
+
+
+def migrate_legacy_state(connection):
+    # Import the state file used by older versions of this script, once.
+    # Returns True if there was a legacy state file to import
+    if not os.path.exists(LEGACY_STATE_FILE_PATH):
+        return False
+    with open(LEGACY_STATE_FILE_PATH, "r") as f:
+        rows = [line.strip().split(",") for line in f if line.strip()]
+    # Anything already in the database is newer than the legacy file
+    connection.executemany(
+        "INSERT OR IGNORE INTO last_run_hashes (application, commit_hash) VALUES (?, ?)",
+        rows,
+    )
+    return True
+
+
+def get_last_hash(connection, application):
+    row = connection.execute(
+        "SELECT commit_hash FROM last_run_hashes WHERE application = ?", (application,)
+    ).fetchone()
+    return row[0] if row is not None else None
+
+
+def set_last_hash(connection, application, commit_hash):
+    connection.execute(
+        "INSERT OR REPLACE INTO last_run_hashes (application, commit_hash) VALUES (?, ?)",
+        (application, commit_hash),
+    )
+
+
+def read_git_log(current_git_commit_hash, last_indexed_hash=None):
+    # Read every commit reachable from HEAD that isn't reachable from the last indexed commit, in a single git log.
+    # Returns (hash, parent hashes, commit message) oldest first, or None if git log fails
+    revisions = [current_git_commit_hash]
+    if last_indexed_hash is not None:
+        revisions.append(f"^{last_indexed_hash}")
+    try:
+        git_log = (
+            subprocess.check_output(
+                [
+                    "git",
+                    "log",
+                    "--reverse",
+                    "--pretty=format:%H %P%x09%s",  # Hash, parent hashes, and commit message
+                    *revisions,
+                ],
+                cwd=SCRIPT_DIRECTORY,
+                stderr=subprocess.DEVNULL,
             )
-            if regex_search:
-                # Create a new file to mark the breaking change
-                with open(breaking_change_file_path, "w") as f:
-                    f.write("Breaking changes detected:\n\n")
-                    f.writelines(
-                        f"{msg} | https://github.com/Dylancyclone/ansible-homelab-orchestration/commit/{commit_hash}\n"
-                        for msg, commit_hash in regex_search
-                    )
-                    f.write("\nPlease review the links above and the documentation for this application:\n")
-                    f.write(
-                        f"https://dylancyclone.github.io/ansible-homelab-orchestration/applications/{application_to_check}"
-                    )
-                    f.write(
-                        f" (or https://dylancyclone.github.io/ansible-homelab-orchestration/archived_applications/{application_to_check} if the application has been deprecated)"
-                    )
-                    f.write(
-                        "\n\nDelete this file once the breaking changes have been resolved.\n"
-                    )
-                sys.exit(1)
-            # If no breaking change was found, just exit with success
-            sys.exit(0)
+            .decode("utf-8", errors="replace")
+            .strip()
+        )
+    except subprocess.CalledProcessError:
+        return None
+
+    commits = []
+    for line in git_log.splitlines():
+        hashes, _, subject = line.partition("\t")
+        commit_hash, *parent_hashes = hashes.split()
+        commits.append((commit_hash, parent_hashes, subject))
+    return commits
+
+
+def read_commit_index_cache():
+    if not os.path.exists(COMMIT_INDEX_FILE_PATH):
+        return None
+    try:
+        with open(COMMIT_INDEX_FILE_PATH, "r") as f:
+            commit_index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if commit_index.get("version") != COMMIT_INDEX_VERSION:
+        return None
+    return commit_index
+
+
+def write_commit_index_cache(commit_index):
+    write_file_atomically(
+        COMMIT_INDEX_FILE_PATH,
+        json.dumps(
+            {key: commit_index[key] for key in ["version", "head", "commits", "parents", "breaking"]},
+            separators=(",", ":"),
+        ),
+    )
+
+
+def load_commit_index(current_git_commit_hash):
+    # The commit index keeps every commit scanned so far, how they're related, and which ones are
+    # breaking changes. It's cached in the state directory and only extended with the commits
+    # made since the last indexed HEAD, so each commit message is only ever parsed once.
+    #   commits:  commit hashes, their position in this list is used to refer to them everywhere else
+    #   parents:  positions of the parents of each commit
+    #   breaking: [position, scope, commit message] of each breaking change commit
+    commit_index = read_commit_index_cache()
+    new_commits = None
+    if commit_index is not None:
+        if commit_index["head"] == current_git_commit_hash:
+            new_commits = []
         else:
-            print(line.strip())
-            sys.exit(0)
+            new_commits = read_git_log(current_git_commit_hash, commit_index["head"])
+    if new_commits is None:
+        # No usable cache (e.g. first run, or the cached head was rewritten away), start from scratch
+        commit_index = {
+            "version": COMMIT_INDEX_VERSION,
+            "head": None,
+            "commits": [],
+            "parents": [],
+            "breaking": [],
+        }
+        new_commits = read_git_log(current_git_commit_hash) or []
+
+    commit_index["positions"] = {
+        commit_hash: position for position, commit_hash in enumerate(commit_index["commits"])
+    }
+    if commit_index["head"] == current_git_commit_hash:
+        return commit_index
+
+    positions = commit_index["positions"]
+    new_commits = [commit for commit in new_commits if commit[0] not in positions]
+    for commit_hash, _, subject in new_commits:
+        position = len(commit_index["commits"])
+        positions[commit_hash] = position
+        commit_index["commits"].append(commit_hash)
+        match = BREAKING_CHANGE_REGEX.match(subject)
+        if match:
+            commit_index["breaking"].append([position, match.group(1).lower(), subject])
+    for _, parent_hashes, _ in new_commits:
+        commit_index["parents"].append(
+            # Parents can be missing from shallow clones, there's nothing before them to check anyway
+            [positions[parent] for parent in parent_hashes if parent in positions]
+        )
+    commit_index["head"] = current_git_commit_hash
+    write_commit_index_cache(commit_index)
+    return commit_index
+
+
+def find_ancestors(position, parents):
+    # Position of every commit reachable from the commit at position (including itself)
+    ancestors = set()
+    to_visit = [position]
+    while to_visit:
+        commit = to_visit.pop()
+        if commit in ancestors:
+            continue
+        ancestors.add(commit)
+        to_visit.extend(parents[commit])
+    return ancestors
+
+
+def build_breaking_change_index(commit_index):
+    # Map of scope -> [(commit hash, position in commits)] of every breaking change
+    index = dict()
+    for position, scope, _ in commit_index["breaking"]:
+        index.setdefault(scope, []).append((commit_index["commits"][position], position))
+    return index
+
+
+def write_breaking_change_file(application, breaking_changes):
+    # Create a new file to mark the breaking change
+    content = "Breaking changes detected:\n\n"
+    content += "".join(
+        f"{msg} | {REPOSITORY_URL}/commit/{commit_hash}\n"
+        for msg, commit_hash in breaking_changes
+    )
+    content += "\nPlease review the links above and the documentation for this application:\n"
+    content += f"{DOCS_URL}/applications/{application}"
+    content += f" (or {DOCS_URL}/archived_applications/{application} if the application has been deprecated)"
+    content += "\n\nDelete this file once the breaking changes have been resolved.\n"
+    write_file_atomically(get_breaking_change_file_path(application), content)
+
+
+def check_applications(applications):
+    # Check every application against the commits made since it was last run.
+    # Returns a map of application -> True if it has a breaking change
+    current_git_commit_hash = (
+        subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=SCRIPT_DIRECTORY)
+        .decode("ascii")
+        .strip()
+    )
+    connection = open_state()
+    try:
+        legacy_state_migrated = migrate_legacy_state(connection)
+        results = check_applications_in_state(
+            connection, applications, current_git_commit_hash
+        )
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+
+    if legacy_state_migrated:
+        try:
+            os.replace(LEGACY_STATE_FILE_PATH, LEGACY_STATE_FILE_PATH + ".migrated")
+        except FileNotFoundError:
+            # Another check got to it first
+            pass
+    return results
+
+
+def check_applications_in_state(connection, applications, current_git_commit_hash):
+    results = dict()
+
+    applications_to_check = []
+    for application in applications:
+        # Check if we're already marked as having a breaking change
+        if os.path.exists(get_breaking_change_file_path(application)):
+            results[application] = True
+            continue
+        last_hash = get_last_hash(connection, application)
+        # Regardless of whether a breaking change will be found, update the state to latest commit hash
+        set_last_hash(connection, application, current_git_commit_hash)
+        if last_hash is None or last_hash == current_git_commit_hash:
+            # New applications and applications that are up to date can't have breaking changes
+            results[application] = False
+        else:
+            applications_to_check.append((application, last_hash))
+
+    if applications_to_check:
+        commit_index = load_commit_index(current_git_commit_hash)
+        index = build_breaking_change_index(commit_index)
+        positions = commit_index["positions"]
+        subjects = {position: subject for position, _, subject in commit_index["breaking"]}
+        current_commits = None
+        already_run_by_hash = dict()
+        for application, last_hash in applications_to_check:
+            scope_commits = index.get(application.lower(), [])
+            if not scope_commits or last_hash not in positions:
+                # No breaking changes were ever made to this application, or the last hash
+                # can't be found (e.g. history was rewritten), so assume the user knows what they're doing
+                results[application] = False
+                continue
+            if current_commits is None:
+                # The index can also hold commits that aren't part of the current history (e.g. other branches)
+                current_commits = find_ancestors(
+                    positions[current_git_commit_hash], commit_index["parents"]
+                )
+            if last_hash not in already_run_by_hash:
+                # Many applications share the same last hash, so only work out each range once
+                already_run_by_hash[last_hash] = find_ancestors(
+                    positions[last_hash], commit_index["parents"]
+                )
+            already_run = already_run_by_hash[last_hash]
+            breaking_changes = [
+                (subjects[position], commit_hash)
+                for commit_hash, position in scope_commits
+                if position in current_commits and position not in already_run
+            ]
+            if breaking_changes:
+                write_breaking_change_file(application, breaking_changes)
+            results[application] = bool(breaking_changes)
+
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] != "--batch":
+        mode = "single"
+    elif len(sys.argv) >= 2 and sys.argv[1] == "--batch":
+        mode = "batch"
     else:
-        print(line.strip())
+        print("Usage: python breaking_changes.py <application_name>")
+        print("       python breaking_changes.py --batch <application_name> [<application_name> ...]")
+        sys.exit(1)
+
+    if mode == "single":
+        results = check_applications([sys.argv[1]])
+        # Exit with failure if a breaking change was found
+        sys.exit(1 if results[sys.argv[1]] else 0)
 
-# If application not found in state file, add it
-with open(state_file_path, "a") as f:
-    f.write(f"{application_to_check},{current_git_commit_hash}\n")
-sys.exit(0)
+    # In batch mode, print every verdict for the playbook to look up
+    results = check_applications(sys.argv[2:])
+    print(
+        json.dumps(
+            {application: {"breaking": breaking} for application, breaking in results.items()}
+        )
+    )
+    sys.exit(0)
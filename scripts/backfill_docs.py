@@ -4,7 +4,7 @@
 
 import os
 from jinja2 import Environment, FileSystemLoader
-import yaml
+from role_model import get_application_roles, load_role_models
 
 
 # Change working directory to script's directory
@@ -12,20 +12,8 @@ dirname = os.path.dirname(os.path.realpath(__file__))
 os.chdir(dirname)
 
 
-all_roles = os.listdir("../roles")
-all_roles.sort()
-roles_to_exclude = ["ansible_homelab_orchestration_general", "breaking_changes", "personal"]
-roles_to_backfill = [role for role in all_roles if role not in roles_to_exclude]
-
-
-def load_yaml_file(file_path):
-    with open(file_path, "r") as f:
-        try:
-            return yaml.safe_load(f)
-        except yaml.YAMLError as e:
-            print(e)
-            return None
-
+roles_to_backfill = get_application_roles()
+role_models = load_role_models(roles_to_backfill)
 
 env = Environment(loader=FileSystemLoader("./templates"), trim_blocks=True)
 docs_template = env.get_template("docs.mdx.j2")
@@ -38,14 +26,14 @@ for role in roles_to_backfill:
         print(f"Skipping {role}, documentation already exists.")
         continue
     print(f"Generating {role}...")
-    defaults_yaml = load_yaml_file(f"../roles/{role}/defaults/main.yml")
+    role_model = role_models[role]
 
     short_name = role
     full_name = input(f"Enter the full name of the role '{role}': ")
 
-    default_port = defaults_yaml.get(f"{short_name}_port", None)
+    default_port = role_model.ports.get(f"{short_name}_port", None)
     if default_port is None:
-        default_port = defaults_yaml.get(f"{short_name}_http_port", None)
+        default_port = role_model.ports.get(f"{short_name}_http_port", None)
     if default_port is None:
         default_port = input(
             f"Enter the default port for {role} (or leave blank if none): "
@@ -0,0 +1,182 @@
+# This module works out the value a variable would have when the playbook runs against an inventory,
+# e.g. `sonarr_dns_accessible: "{{ traefik_enable_dns_for_all }}"` is true if the inventory enables it.
+#
+# Usage:
+#   from effective_config import EffectiveConfig
+#   config = EffectiveConfig(load_role_models().values(), "example")
+#   config.is_enabled("sonarr")
+#   config.get("sonarr_port")
+#
+# Variables are read in the order Ansible gives them precedence: role defaults, the inventory's
+# group_vars/all.yml, the project's group_vars/all.yml, then the inventory's other group_vars.
+# A variable is only rendered once something asks for it, and is rendered only once.
+# Templates are rendered in a sandbox, with only the filters variables in this project need.
+# Anything that needs the host, like facts or lookups, can't be resolved and raises UnresolvedVariable.
+
+import ast
+import os
+import re
+import yaml
+from jinja2 import StrictUndefined, TemplateError, meta
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+PROJECT_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+INVENTORIES_DIRECTORY = f"{PROJECT_DIRECTORY}/inventories"
+
+# Value Ansible gives `omit`, so a parameter that is omitted can be told apart
+OMIT = "__omit_place_holder__"
+
+# A template that is only a variable, e.g. "{{ sonarr_port }}", is the variable's value, not its text
+VARIABLE_TEMPLATE_PATTERN = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+class UnresolvedVariable(Exception):
+    def __init__(self, name, reason):
+        super().__init__(f"Can't resolve `{name}`: {reason}")
+        self.name = name
+        self.reason = reason
+
+
+def to_bool(value):
+    # Same as Ansible's bool filter
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("yes", "on", "1", "true", "y")
+
+
+def load_variables_file(file_path):
+    with open(file_path, "r") as f:
+        data = yaml.safe_load(f)
+    return data if isinstance(data, dict) else dict()
+
+
+def get_inventory_directory(inventory):
+    # An inventory can be given by its name in inventories/ or by its directory
+    if os.path.isdir(inventory):
+        return inventory
+    return f"{INVENTORIES_DIRECTORY}/{inventory}"
+
+
+def get_group_vars_files(group_vars_directory, groups):
+    # group_vars/<group>.yml, or every file in group_vars/<group>/
+    file_paths = []
+    for group in groups:
+        for extension in ["", ".yml", ".yaml"]:
+            path = f"{group_vars_directory}/{group}{extension}"
+            if os.path.isfile(path) and extension:
+                file_paths.append(path)
+            elif os.path.isdir(path) and not extension:
+                file_paths.extend(
+                    os.path.join(path, file) for file in sorted(os.listdir(path)) if file.endswith((".yml", ".yaml"))
+                )
+    return file_paths
+
+
+class EffectiveConfig:
+    def __init__(self, role_models, inventory=None):
+        # Map of variable -> raw value, and the file it came from
+        self.variables = dict()
+        self.sources = dict()
+        # Map of variable -> rendered value, for variables that were asked for
+        self.resolved = dict()
+        self.resolving = set()
+        self.environment = ImmutableSandboxedEnvironment(undefined=StrictUndefined)
+        self.environment.filters["bool"] = to_bool
+        self.environment.globals["omit"] = OMIT
+
+        for model in role_models:
+            self.add_variables(model.defaults or {}, f"roles/{model.name}/defaults/main.yml")
+        inventory_group_vars_directory = None
+        inventory_groups = []
+        if inventory is not None:
+            inventory_directory = get_inventory_directory(inventory)
+            if not os.path.isdir(inventory_directory):
+                raise FileNotFoundError(f"Inventory `{inventory}` not found in {INVENTORIES_DIRECTORY}")
+            inventory_group_vars_directory = f"{inventory_directory}/group_vars"
+            if os.path.isdir(inventory_group_vars_directory):
+                inventory_groups = sorted(
+                    set(os.path.splitext(file)[0] for file in os.listdir(inventory_group_vars_directory)) - {"all"}
+                )
+        file_paths = []
+        if inventory_group_vars_directory is not None:
+            file_paths += get_group_vars_files(inventory_group_vars_directory, ["all"])
+        file_paths += get_group_vars_files(f"{PROJECT_DIRECTORY}/group_vars", ["all"])
+        if inventory_group_vars_directory is not None:
+            file_paths += get_group_vars_files(inventory_group_vars_directory, inventory_groups)
+        for file_path in file_paths:
+            self.add_variables(load_variables_file(file_path), os.path.relpath(file_path, PROJECT_DIRECTORY))
+
+    def add_variables(self, variables, source):
+        for name, value in variables.items():
+            self.variables[name] = value
+            self.sources[name] = source
+
+    def __contains__(self, name):
+        return name in self.variables
+
+    def resolve(self, name):
+        if name in self.resolved:
+            return self.resolved[name]
+        if name not in self.variables:
+            raise UnresolvedVariable(name, "it isn't defined")
+        if name in self.resolving:
+            raise UnresolvedVariable(name, "it refers to itself")
+        self.resolving.add(name)
+        try:
+            value = self.render(self.variables[name])
+        finally:
+            self.resolving.discard(name)
+        self.resolved[name] = value
+        return value
+
+    def get(self, name, default=None):
+        try:
+            return self.resolve(name)
+        except UnresolvedVariable:
+            return default
+
+    def evaluate(self, value, default=None):
+        # Rendered value, or default if it can't be resolved
+        try:
+            return self.render(value)
+        except UnresolvedVariable:
+            return default
+
+    def is_enabled(self, role):
+        return to_bool(self.get(f"{role}_enabled", False))
+
+    def render(self, value):
+        if isinstance(value, list):
+            return [self.render(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.render(item) for key, item in value.items()}
+        if not isinstance(value, str) or ("{{" not in value and "{%" not in value):
+            return value
+        match = VARIABLE_TEMPLATE_PATTERN.fullmatch(value.strip())
+        if match is not None and match.group(1) not in self.environment.globals:
+            return self.resolve(match.group(1))
+
+        try:
+            names = meta.find_undeclared_variables(self.environment.parse(value))
+        except TemplateError as e:
+            raise UnresolvedVariable(value, str(e))
+        # Variables that can't be resolved are left undefined, they only fail if the template actually uses them
+        context = dict()
+        for name in names:
+            if name in self.environment.globals:
+                continue
+            try:
+                context[name] = self.resolve(name)
+            except UnresolvedVariable:
+                pass
+        try:
+            rendered = self.environment.from_string(value).render(context)
+        except TemplateError as e:
+            raise UnresolvedVariable(value, str(e))
+        # Like Ansible, text that is a list, dict or boolean becomes one
+        if rendered.startswith(("[", "{")) or rendered in ("True", "False"):
+            try:
+                return ast.literal_eval(rendered)
+            except (ValueError, SyntaxError):
+                pass
+        return rendered
@@ -0,0 +1,181 @@
+# This script adds up the memory limits of every container the applications enabled in an inventory start,
+# and compares them to the memory of the host, to warn before a deploy gives containers more memory than there is.
+#
+# Usage: python memory_budget.py [--inventory NAME] [--host HOST] [--host-memory SIZE] [--max-percent N]
+#
+# The host's memory is read from the facts Ansible cached for it in state/facts_cache, unless --host-memory is given
+# (e.g. `16g`). CPU limits (`cpus`) are added up too, and compared to the host's CPUs, for containers that set one.
+# Exits with 1 if the limits add up to more than --max-percent (default: 100) of the host's memory.
+# The playbook runs the same check before any application is set up, see action_plugins/check_memory_budget.py.
+
+import argparse
+import json
+import os
+import re
+import sys
+
+# Bytes in each unit Docker accepts for a memory limit, e.g. `512m` or `1g`
+MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+MEMORY_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+FACTS_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "../state/facts_cache")
+CACHE_FILE_PREFIX_PATTERN = re.compile(r"^s\d+_")
+
+
+def parse_memory(value):
+    # Bytes of a memory limit, 0 if the container has no limit, or None if it isn't one
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = MEMORY_PATTERN.match(str(value))
+    if match is None:
+        return None
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()])
+
+
+def parse_cpus(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_memory(memory):
+    for unit in ["t", "g", "m", "k"]:
+        if memory >= MEMORY_UNITS[unit]:
+            return f"{memory / MEMORY_UNITS[unit]:.1f}{unit.upper()}"
+    return f"{memory}B"
+
+
+def get_container_limits(model, render):
+    # (container, memory, cpus) of every container a role starts, with its variables rendered by render.
+    # Memory is None if it can't be worked out, cpus is None if the container doesn't set them
+    limits = []
+    for container in model.containers:
+        name = render(container.name)
+        memory = parse_memory(render(container.memory)) if container.memory is not None else None
+        cpus = parse_cpus(render(container.cpus)) if container.cpus is not None else None
+        limits.append((name if isinstance(name, str) else container.name, memory, cpus))
+    return limits
+
+
+def get_cache_host(file):
+    # Host a cached facts file is for. ansible-core 2.19 and later prefix it with its format, e.g. `s1_server`
+    return CACHE_FILE_PREFIX_PATTERN.sub("", file)
+
+
+def get_cached_hosts():
+    if not os.path.isdir(FACTS_CACHE_DIRECTORY):
+        return []
+    return sorted(set(get_cache_host(file) for file in os.listdir(FACTS_CACHE_DIRECTORY)))
+
+
+def load_cached_facts(host):
+    # Facts Ansible cached for a host, or None if there aren't any
+    if not os.path.isdir(FACTS_CACHE_DIRECTORY):
+        return None
+    for file in sorted(os.listdir(FACTS_CACHE_DIRECTORY)):
+        if get_cache_host(file) != host:
+            continue
+        try:
+            with open(f"{FACTS_CACHE_DIRECTORY}/{file}", "r") as f:
+                facts = json.load(f)
+            # ansible-core 2.19 and later keep the facts as JSON text in `__payload__`
+            if isinstance(facts, dict) and "__payload__" in facts:
+                facts = json.loads(facts["__payload__"])
+            return facts
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add up the memory limits of the enabled applications")
+    parser.add_argument(
+        "--inventory",
+        default="example",
+        help="Inventory whose enabled applications are added up, a name in inventories/ or a directory (default: example)",
+    )
+    parser.add_argument(
+        "--host",
+        help="Host whose cached facts hold its memory (default: the only host with cached facts)",
+    )
+    parser.add_argument(
+        "--host-memory",
+        help="Memory of the host (e.g. `16g`), instead of reading it from cached facts",
+    )
+    parser.add_argument(
+        "--max-percent",
+        type=int,
+        default=100,
+        help="Percentage of the host's memory the limits may add up to (default: 100)",
+    )
+    args = parser.parse_args()
+
+    # Only needed here, so the helpers above can be used without jinja2
+    from effective_config import EffectiveConfig
+    from role_model import load_role_models
+
+    role_models = load_role_models()
+    config = EffectiveConfig(role_models.values(), args.inventory)
+
+    def render(value):
+        return config.evaluate(value)
+
+    total_memory = 0
+    total_cpus = 0
+    unknown_containers = []
+    unlimited_containers = []
+    print(f"{'Application':<30} {'Container':<35} {'Memory':>8} {'CPUs':>6}")
+    for role, model in role_models.items():
+        if not config.is_enabled(role):
+            continue
+        for container, memory, cpus in get_container_limits(model, render):
+            if memory is None:
+                unknown_containers.append(container)
+            elif memory == 0:
+                unlimited_containers.append(container)
+            total_memory += memory or 0
+            total_cpus += cpus or 0
+            memory_text = "?" if memory is None else "none" if memory == 0 else format_memory(memory)
+            cpus_text = "" if cpus is None else f"{cpus:g}"
+            print(f"{role:<30} {container:<35} {memory_text:>8} {cpus_text:>6}")
+    print()
+    print(f"{'Total':<66} {format_memory(total_memory):>8} {(f'{total_cpus:g}' if total_cpus else ''):>6}")
+    if unlimited_containers:
+        print(f"Containers without a memory limit, not counted: {', '.join(unlimited_containers)}")
+    if unknown_containers:
+        print(f"Containers whose memory limit couldn't be worked out, not counted: {', '.join(unknown_containers)}")
+
+    host_memory = None
+    host_cpus = None
+    if args.host_memory:
+        host_memory = parse_memory(args.host_memory)
+    else:
+        host = args.host
+        if host is None:
+            hosts = get_cached_hosts()
+            host = hosts[0] if len(hosts) == 1 else None
+        facts = load_cached_facts(host) if host is not None else None
+        # memtotal_mb is cached by the playbook's memory budget check, ansible_memtotal_mb by a hardware gather
+        memtotal_mb = (facts or {}).get("ansible_memtotal_mb", (facts or {}).get("memtotal_mb"))
+        if memtotal_mb:
+            host_memory = memtotal_mb * MEMORY_UNITS["m"]
+            host_cpus = facts.get("ansible_processor_vcpus")
+    if host_memory is None:
+        print()
+        print("Host memory unknown, run the playbook once to cache the host's facts, or give --host (or --host-memory)")
+        return
+
+    budget = host_memory * args.max_percent // 100
+    print()
+    print(f"Host memory: {format_memory(host_memory)}, limits add up to {total_memory * 100 / host_memory:.0f}% of it")
+    if host_cpus and total_cpus > host_cpus:
+        print(f"Warning: CPU limits add up to {total_cpus:g}, more than the host's {host_cpus} CPUs")
+    if total_memory > budget:
+        print(f"Warning: memory limits add up to more than {args.max_percent}% of the host's memory")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
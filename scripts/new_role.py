@@ -4,7 +4,10 @@
 # Then follow on-screen prompts.
 
 import os
+import sys
 from jinja2 import Environment, FileSystemLoader
+from port_index import MAX_PORT, build_port_index
+from role_model import load_role_models
 
 
 # Change working directory to script's directory
@@ -23,6 +26,9 @@ print(
 print("then modify the generated files later to add the additional containers.")
 print()
 
+# Existing roles, to avoid reusing their names, ports and hostnames
+role_models = load_role_models()
+
 # Gather information
 full_name = input("Enter the full name of the role: ")
 default_short_name = full_name.lower().replace(" ", "_").replace("-", "_")
@@ -33,6 +39,9 @@ if short_name.strip() == "":
     short_name = default_short_name
 else:
     short_name = short_name.lower().replace(" ", "_").replace("-", "_")
+if short_name in role_models:
+    print(f"A role called `{short_name}` already exists.")
+    sys.exit(1)
 
 while True:
     docker_container = input(
@@ -48,17 +57,43 @@ if docker_tag.strip() == "":
 has_directories = input("Does the app need data directories (Y/n): ")
 has_directories = has_directories.lower() != "n"
 
-default_port = input("Enter the default port the app uses (or leave blank if none): ")
-if default_port.strip() == "":
-    default_port = None
+port_index = build_port_index(role_models.values())
+while True:
+    default_port = input("Enter the default port the app uses (or leave blank if none): ")
+    if default_port.strip() == "":
+        default_port = None
+        break
+    if not default_port.strip().isdigit() or not 0 < int(default_port) <= MAX_PORT:
+        print(f"`{default_port.strip()}` isn't a port, enter a number from 1 to {MAX_PORT}.")
+        continue
+    default_port = default_port.strip()
+    port_protocol = input("Does the app use the port over TCP or UDP (TCP/udp): ")
+    port_protocol = "udp" if port_protocol.strip().lower() == "udp" else "tcp"
+    port_users = port_index.find_users(int(default_port), port_protocol)
+    if not port_users:
+        break
+    next_free_port = port_index.next_free_port(int(default_port), port_protocol)
+    print(f"Port {default_port}/{port_protocol} is already used by `{port_users[0]}`, please pick another one (the next free port is {next_free_port}).")
 
 if default_port is not None:
-    has_web_interface = input("Does the app have a web interface (Y/n): ")
-    network_enabled = has_web_interface.lower() != "n"
+    # Traefik only routes web interfaces over TCP
+    if port_protocol == "tcp":
+        has_web_interface = input("Does the app have a web interface (Y/n): ")
+        network_enabled = has_web_interface.lower() != "n"
+    else:
+        network_enabled = False
+    hostnames_in_use = {
+        str(hostname): hostname_variable
+        for role_model in role_models.values()
+        for hostname_variable, hostname in role_model.hostnames.items()
+    }
+    if network_enabled and short_name in hostnames_in_use:
+        print(f"Hostname `{short_name}` is already used by `{hostnames_in_use[short_name]}`, change `{short_name}_hostname` once the role is generated.")
 
     has_docker_network = input("Does the app need its own Docker Network (y/N): ")
     has_docker_network = has_docker_network.lower() == "y"
 else:
+    port_protocol = None
     network_enabled = False
     has_docker_network = False
 
@@ -79,6 +114,7 @@ for template in [defaults_template, tasks_template, docs_template]:
         short_name=short_name,
         has_directories=has_directories,
         default_port=default_port,
+        port_protocol=port_protocol,
         network_enabled=network_enabled,
         has_docker_network=has_docker_network,
         docker_container=docker_container,
@@ -90,14 +126,18 @@ for template in [defaults_template, tasks_template, docs_template]:
         file.write(output_from_parsed_template)
     print(f"Generated {output_filename}")
 
+# Make the new role's defaults available to every other role
+defaults_link = f"../roles/ansible_homelab_orchestration_general/defaults/main/{short_name}.yml"
+if not os.path.lexists(defaults_link):
+    os.symlink(f"../../../{short_name}/defaults/main.yml", defaults_link)
+print(f"Linked {defaults_link}")
+
 print()
 print("Role generation complete!")
 print("Please review and modify the generated files as necessary to fit your application's needs.")
 print()
-print("Now, please add the following to playbook.yml alphabetically to include the new role:")
+print("Now, please add the following to the `applications` of the `Applications` group in playbook.yml alphabetically to include the new role:")
 print()
-print(f"    - role: {short_name}")
-print(f"      tags: {short_name}")
-print(f"      when: {short_name}_enabled or ({short_name}_container_names | intersect(running_containers) | length > 0)")
+print(f"          - {short_name}")
 print()
 print("Don't forget to run linting and tests once you're done to ensure everything is set up correctly!")
\ No newline at end of file
@@ -0,0 +1,138 @@
+# This module indexes the host ports every application uses, to find ports used by more than one of them
+# and ports that are still free.
+#
+# Usage:
+#   from port_index import build_port_index
+#   port_index = build_port_index(load_role_models().values())
+#   port_index.find_conflicts()  # e.g. [("tcp", 8080, 8080, ["sonarr_port", "radarr_port"])]
+#   port_index.next_free_port(8080)
+#
+# A port can be a single port (8080) or a range ("6881-6889"), used over TCP, UDP or both.
+# Ports come from a role's `_port` variables, its host mode containers and its traefik entrypoints.
+
+import bisect
+import re
+
+MAX_PORT = 65535
+PROTOCOLS = ["tcp", "udp"]
+
+# A port variable mapped to a container port, e.g. `"{{ sonarr_port }}:8989"` or `"0.0.0.0:{{ x_port }}:53/udp"`
+PORT_MAPPING_PATTERN = re.compile(r"\{\{\s*([a-z0-9_]+)\s*\}\}:[^:/]+(?:/(tcp|udp))?$")
+
+
+def parse_port_range(value):
+    # (first, last) port of a port or port range, or None if it isn't one (e.g. a variable)
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return (value, value)
+    parts = str(value).strip().split("-")
+    if len(parts) > 2 or not all(part.strip().isdigit() for part in parts):
+        return None
+    first, last = int(parts[0]), int(parts[-1])
+    if first > last:
+        return None
+    return (first, last)
+
+
+def format_port_range(first, last):
+    return str(first) if first == last else f"{first}-{last}"
+
+
+def get_port_protocols(model):
+    # Map of port variable -> protocols it's used with, from how the role's containers map it.
+    # Variables that aren't mapped are UDP if `_udp_` is in their name, otherwise TCP
+    port_protocols = dict()
+    for container in model.containers:
+        for port_mapping in container.ports:
+            match = PORT_MAPPING_PATTERN.search(str(port_mapping))
+            if match is not None:
+                port_protocols.setdefault(match.group(1), set()).add(match.group(2) or "tcp")
+    return {
+        key: sorted(port_protocols.get(key, ["udp" if "_udp_" in key else "tcp"]))
+        for key in model.ports
+    }
+
+
+def get_role_ports(model):
+    # Every port a role uses, as [name, port, protocol] so it can be stored as JSON
+    role_ports = []
+    if model.defaults is not None:
+        for key, protocols in get_port_protocols(model).items():
+            for protocol in protocols:
+                role_ports.append([key, model.ports[key], protocol])
+    if model.name != "traefik":  # Don't need to worry about traefik colliding with itself
+        for key, port in model.host_mode_ports.items():
+            role_ports.append([key, port, "tcp"])
+    for name, port in model.entrypoints.items():
+        variable = port.replace("{{", "").replace("}}", "").strip()
+        if variable in model.ports:
+            # Already used through the variable
+            continue
+        role_ports.append([f"{model.name} (entrypoint {name})", port, "tcp"])
+    return role_ports
+
+
+class PortIndex:
+    # Ports by protocol, kept as (first, last, name) intervals sorted by their first port
+
+    def __init__(self):
+        self.intervals = {protocol: [] for protocol in PROTOCOLS}
+        self.sorted = True
+
+    def add(self, name, port, protocol="tcp"):
+        # Ports that aren't a port or range, e.g. variables, can't conflict and are left out
+        port_range = parse_port_range(port)
+        if port_range is None:
+            return
+        self.intervals[protocol].append((port_range[0], port_range[1], name))
+        self.sorted = False
+
+    def sort(self):
+        if not self.sorted:
+            for intervals in self.intervals.values():
+                intervals.sort()
+            self.sorted = True
+
+    def find_conflicts(self):
+        # Groups of ports that overlap, as (protocol, first, last, names), in port order.
+        # Intervals are sorted, so a group ends at the first interval starting after every interval before it
+        self.sort()
+        conflicts = []
+        for protocol in PROTOCOLS:
+            group = []
+            group_last = -1
+            for first, last, name in self.intervals[protocol] + [(MAX_PORT + 1, MAX_PORT + 1, None)]:
+                if first > group_last:
+                    if len(group) > 1:
+                        conflicts.append((protocol, group[0][0], group_last, [name for _, _, name in group]))
+                    group = []
+                group.append((first, last, name))
+                group_last = max(group_last, last) if len(group) > 1 else last
+        return conflicts
+
+    def find_users(self, port, protocol="tcp"):
+        # Names of the ports that include port
+        self.sort()
+        intervals = self.intervals[protocol]
+        position = bisect.bisect_right(intervals, (port, MAX_PORT + 1))
+        return [name for first, last, name in intervals[:position] if last >= port]
+
+    def next_free_port(self, port, protocol="tcp", count=1):
+        # First port from port on, followed by count - 1 more free ports, or None if there isn't one
+        self.sort()
+        for first, last, _ in self.intervals[protocol]:
+            if last < port:
+                continue
+            if first >= port + count:
+                break
+            port = last + 1
+        return port if port + count - 1 <= MAX_PORT else None
+
+
+def build_port_index(role_models):
+    port_index = PortIndex()
+    for model in role_models:
+        for name, port, protocol in get_role_ports(model):
+            port_index.add(name, port, protocol)
+    return port_index
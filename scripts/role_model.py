@@ -0,0 +1,435 @@
+# This module reads an application role into a compact model, so tests and scripts don't each parse
+# and walk the role's YAML files their own way.
+#
+# Usage:
+#   from role_model import load_role_models
+#   models = load_role_models(["sonarr", "radarr"])
+#   models["sonarr"].ports  # e.g. {"sonarr_port": 8989}
+#
+# A model holds the role's defaults, the tasks of its start and stop blocks, its containers, networks,
+# ports, hostnames, directories and the facts it uses, along with the line each of them is on.
+# Models are cached in scripts/.role_model_cache.pickle, keyed by a hash of the role's files,
+# so a role is only parsed again once one of its files changed.
+
+import hashlib
+import os
+import pickle
+import re
+import yaml
+
+PROJECT_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+ROLES_DIRECTORY = f"{PROJECT_DIRECTORY}/roles"
+ROLE_MODEL_CACHE_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), ".role_model_cache.pickle"
+)
+# Bump when the model changes, so cached models are built again
+ROLE_MODEL_VERSION = 3
+
+# Roles that aren't applications
+NON_APPLICATION_ROLES = [
+    "ansible_homelab_orchestration_general",
+    "breaking_changes",
+    "personal",
+]
+
+# Containers are created and removed with this action, which only runs DOCKER_CONTAINER_MODULE if something changed
+DOCKER_CONTAINER_ACTION = "cached_docker_container"
+DOCKER_CONTAINER_MODULE = "community.docker.docker_container"
+DOCKER_NETWORK_ACTION = "community.docker.docker_network"
+
+# Keys of a task that aren't its action
+TASK_KEYWORDS = frozenset(
+    (
+        "name", "when", "register", "tags", "vars", "notify", "listen", "loop", "loop_control",
+        "with_items", "with_dict", "with_fileglob", "until", "retries", "delay", "async", "poll",
+        "changed_when", "failed_when", "ignore_errors", "no_log", "run_once", "delegate_to", "become",
+        "become_user", "environment", "args", "check_mode", "diff", "block", "rescue", "always",
+    )
+)
+
+# Facts used as `ansible_<fact>` or `ansible_facts.<fact>`
+FACT_PATTERN = re.compile(r"ansible_(?:facts\.|facts\[[\"'])?([a-z0-9_]+)")
+
+# Traefik entrypoints in a template, e.g. `[entryPoints.web]` followed by `address = ":{{ traefik_http_port }}"`
+ENTRYPOINT_PATTERN = re.compile(r'\[entryPoints\.([A-Za-z0-9_-]+)\]\s*address\s*=\s*"[^"]*:([^":]+)"')
+
+
+# libyaml's parser is much faster than the pure Python one, but isn't always installed
+try:
+    from yaml import CSafeLoader as BaseYamlLoader
+except ImportError:
+    from yaml import SafeLoader as BaseYamlLoader
+
+
+class YamlLoader(BaseYamlLoader):
+    # Safe loader that also records where every mapping and sequence is from the parser's node marks.
+    # Marks are stored by the id() of the constructed object, along with the object itself to keep the id unique.
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.marks = dict()
+
+    def construct_object(self, node, deep=False):
+        data = super().construct_object(node, deep)
+        if isinstance(node, yaml.MappingNode):
+            key_lines = dict()
+            for key_node, _ in node.value:
+                if isinstance(key_node, yaml.ScalarNode):
+                    key_lines.setdefault(key_node.value, key_node.start_mark.line + 1)
+            self.marks[id(data)] = (data, node.start_mark.line + 1, key_lines)
+        elif isinstance(node, yaml.SequenceNode):
+            item_lines = [item_node.start_mark.line + 1 for item_node in node.value]
+            self.marks[id(data)] = (data, node.start_mark.line + 1, item_lines)
+        return data
+
+
+class YamlFile:
+    # Parsed YAML data, plus the line numbers of any mapping or sequence in it.
+    # Line numbers are -1 if they can't be found.
+
+    def __init__(self, data, marks):
+        self.data = data
+        self.marks = marks
+
+    def line_number(self, value):
+        # Line a mapping or sequence starts on, e.g. the first line of a task
+        mark = self.marks.get(id(value))
+        return mark[1] if mark is not None else -1
+
+    def key_line_number(self, key, mapping=None):
+        # Line of a key in a mapping, defaults to the top level mapping of the file
+        mark = self.marks.get(id(self.data if mapping is None else mapping))
+        if mark is None or not isinstance(mark[2], dict):
+            return -1
+        return mark[2].get(key, -1)
+
+    def key_line_numbers(self, mapping):
+        # Line of every key in a mapping
+        mark = self.marks.get(id(mapping))
+        return dict(mark[2]) if mark is not None and isinstance(mark[2], dict) else dict()
+
+    def item_line_number(self, sequence, item):
+        # Line of the first item in a sequence that is equal to item
+        mark = self.marks.get(id(sequence))
+        if mark is None or not isinstance(mark[2], list) or item not in sequence:
+            return -1
+        return mark[2][sequence.index(item)]
+
+    def item_line_numbers(self, sequence):
+        # Line of every item in a sequence
+        mark = self.marks.get(id(sequence))
+        return list(mark[2]) if mark is not None and isinstance(mark[2], list) else []
+
+
+def load_yaml_file(file_path):
+    # Read the file only once, then parse the text that was read
+    with open(file_path, "r") as f:
+        text = f.read()
+    loader = YamlLoader(text)
+    try:
+        data = loader.get_single_data()
+    except yaml.YAMLError as e:
+        print(e)
+        data = None
+    finally:
+        loader.dispose()
+    return YamlFile(data, loader.marks)
+
+
+class Task:
+    # A task of a role, e.g. `- name: Start Sonarr` with its action (e.g. cached_docker_container) and arguments
+
+    __slots__ = ("name", "action", "args", "keywords", "line", "key_lines", "arg_lines")
+
+    def __init__(self, data, yaml_file):
+        self.name = data.get("name", "")
+        self.action = next((key for key in data if key not in TASK_KEYWORDS), None)
+        args = data.get(self.action) if self.action is not None else None
+        self.args = args if isinstance(args, dict) else dict()
+        # Every other key of the task, e.g. async and poll
+        self.keywords = {key: value for key, value in data.items() if key != self.action}
+        self.line = yaml_file.line_number(data)
+        self.key_lines = yaml_file.key_line_numbers(data)
+        self.arg_lines = yaml_file.key_line_numbers(args)
+
+
+class Container:
+    # A container a role starts or removes, and the task it's started or removed by
+
+    __slots__ = ("name", "image", "pull", "network_mode", "restart_policy", "memory", "cpus", "ports", "labels", "label_lines", "task")
+
+    def __init__(self, task, yaml_file, labels):
+        args = task.args
+        self.name = args.get("name", "")
+        self.image = args.get("image", "")
+        # None if the task doesn't set them
+        self.pull = args.get("pull")
+        self.memory = args.get("memory")
+        self.cpus = args.get("cpus")
+        self.network_mode = args.get("network_mode", "")
+        self.restart_policy = args.get("restart_policy", "")
+        self.ports = args.get("ports") or []
+        self.labels = labels if isinstance(labels, dict) else dict()
+        self.label_lines = yaml_file.key_line_numbers(labels)
+        self.task = task
+
+
+class Network:
+    # A network a role creates or removes, and the task it's created or removed by
+
+    __slots__ = ("name", "task")
+
+    def __init__(self, task):
+        self.name = task.args.get("name", "")
+        self.task = task
+
+
+class RoleModel:
+    # Everything tests and scripts need to know about a role, with the line each part is on.
+    # defaults and the task lists are None if their file couldn't be parsed
+
+    __slots__ = (
+        "name",
+        "defaults",
+        "default_lines",
+        "default_item_lines",
+        "start_tasks",
+        "stop_tasks",
+        "containers",
+        "removed_containers",
+        "networks",
+        "removed_networks",
+        "ports",
+        "hostnames",
+        "directory_variables",
+        "directories",
+        "container_names",
+        "container_images",
+        "gather_subset",
+        "facts",
+        "host_mode_ports",
+        "entrypoints",
+    )
+
+    def default_line(self, key):
+        return self.default_lines.get(key, -1)
+
+    def default_item_line(self, key, item):
+        # Line of the first item of a list variable that is equal to item
+        items = self.defaults.get(key) if self.defaults is not None else None
+        if not isinstance(items, list) or item not in items:
+            return -1
+        item_lines = self.default_item_lines.get(key, [])
+        index = items.index(item)
+        return item_lines[index] if index < len(item_lines) else -1
+
+
+def get_template_files(role):
+    template_files = []
+    for root, _, files in os.walk(f"{ROLES_DIRECTORY}/{role}/templates"):
+        template_files.extend(os.path.join(root, file) for file in files)
+    return sorted(template_files)
+
+
+def get_role_files(role):
+    # Every file a role's model is built from
+    return [
+        f"{ROLES_DIRECTORY}/{role}/defaults/main.yml",
+        f"{ROLES_DIRECTORY}/{role}/tasks/main.yml",
+    ] + get_template_files(role)
+
+
+def hash_file(hash, file_path):
+    # Missing files are part of the key too, e.g. a role's documentation being added
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as f:
+            hash.update(f.read())
+    else:
+        hash.update(b"missing")
+    hash.update(b"\0")
+
+
+def get_role_model_key(role):
+    hash = hashlib.sha256(str(ROLE_MODEL_VERSION).encode())
+    for file_path in get_role_files(role):
+        hash.update(os.path.relpath(file_path, ROLES_DIRECTORY).encode())
+        hash_file(hash, file_path)
+    return hash.hexdigest()
+
+
+def find_facts(file_paths):
+    # Map of fact -> (file relative to the project, line) it's first used at
+    facts = dict()
+    for file_path in file_paths:
+        try:
+            with open(file_path, "r") as f:
+                lines = f.readlines()
+        except (OSError, UnicodeDecodeError):
+            continue
+        for line_number, line in enumerate(lines, 1):
+            for fact in FACT_PATTERN.findall(line):
+                facts.setdefault(
+                    fact, (os.path.relpath(file_path, PROJECT_DIRECTORY), line_number)
+                )
+    return facts
+
+
+def find_entrypoints(file_paths):
+    # Map of traefik entrypoint -> port it listens on, e.g. {"web": "{{ traefik_http_port }}"}
+    entrypoints = dict()
+    for file_path in file_paths:
+        try:
+            with open(file_path, "r") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        for name, port in ENTRYPOINT_PATTERN.findall(text):
+            entrypoints.setdefault(name, port.strip())
+    return entrypoints
+
+
+def load_tasks(yaml_file, block_index):
+    # Tasks of one of the blocks of a tasks file, the first block starts the application and the second stops it
+    if not isinstance(yaml_file.data, list) or len(yaml_file.data) <= block_index:
+        return []
+    block = yaml_file.data[block_index].get("block") or []
+    return [Task(task, yaml_file) for task in block]
+
+
+def build_role_model(role):
+    model = RoleModel()
+    model.name = role
+
+    defaults_path = f"{ROLES_DIRECTORY}/{role}/defaults/main.yml"
+    defaults_file = load_yaml_file(defaults_path) if os.path.exists(defaults_path) else YamlFile(None, {})
+    defaults = defaults_file.data if isinstance(defaults_file.data, dict) else None
+    model.defaults = defaults
+    model.default_lines = defaults_file.key_line_numbers(defaults)
+    model.default_item_lines = {
+        key: defaults_file.item_line_numbers(value)
+        for key, value in (defaults or {}).items()
+        if isinstance(value, list)
+    }
+    model.ports = dict()
+    model.hostnames = dict()
+    model.directory_variables = []
+    for key, value in (defaults or {}).items():
+        if key.endswith("_port"):
+            model.ports[key] = value
+        if key.endswith("_hostname"):
+            model.hostnames[key] = value
+        if key.endswith("_directory"):
+            model.directory_variables.append(key)
+    defaults = defaults or {}
+    model.container_names = defaults.get(f"{role}_container_names")
+    model.container_images = defaults.get(f"{role}_container_images")
+    model.directories = defaults.get(f"{role}_directories")
+    gather_subset = defaults.get(f"{role}_gather_subset")
+    model.gather_subset = gather_subset if isinstance(gather_subset, list) else []
+
+    tasks_path = f"{ROLES_DIRECTORY}/{role}/tasks/main.yml"
+    tasks_file = load_yaml_file(tasks_path) if os.path.exists(tasks_path) else YamlFile(None, {})
+    if tasks_file.data is None:
+        model.start_tasks = None
+        model.stop_tasks = None
+    else:
+        model.start_tasks = load_tasks(tasks_file, 0)
+        model.stop_tasks = load_tasks(tasks_file, 1)
+    model.containers = [
+        Container(task, tasks_file, task.args.get("labels"))
+        for task in model.start_tasks or []
+        if task.action == DOCKER_CONTAINER_ACTION
+    ]
+    model.removed_containers = [
+        Container(task, tasks_file, task.args.get("labels"))
+        for task in model.stop_tasks or []
+        if task.action in (DOCKER_CONTAINER_ACTION, DOCKER_CONTAINER_MODULE)
+    ]
+    model.networks = [
+        Network(task) for task in model.start_tasks or [] if task.action == DOCKER_NETWORK_ACTION
+    ]
+    model.removed_networks = [
+        Network(task) for task in model.stop_tasks or [] if task.action == DOCKER_NETWORK_ACTION
+    ]
+
+    # Host mode containers don't map ports, the port traefik is told to use is the one they listen on.
+    # Ports that are variables are already in ports
+    model.host_mode_ports = dict()
+    loadbalancer_label = f"traefik.http.services.{role}.loadbalancer.server.port"
+    for container in model.containers:
+        port = str(container.labels.get(loadbalancer_label, ""))
+        if container.network_mode == "host" and port.isdigit():
+            model.host_mode_ports[f"{role} (host mode)"] = int(port)
+
+    model.facts = find_facts(get_role_files(role))
+    model.entrypoints = find_entrypoints(get_template_files(role))
+    return model
+
+
+class RoleModelCache:
+    # Built models by role, along with the key of the files they were built from
+
+    def __init__(self, file_path=ROLE_MODEL_CACHE_FILE_PATH):
+        self.file_path = file_path
+        self.entries = dict()
+        self.changed = False
+        if not os.path.exists(file_path):
+            return
+        try:
+            with open(file_path, "rb") as f:
+                cache = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ImportError):
+            return
+        if isinstance(cache, dict) and cache.get("version") == ROLE_MODEL_VERSION:
+            self.entries = cache["roles"]
+
+    def get(self, role, key=None):
+        # Cached model of a role, or None if its files changed since it was built
+        entry = self.entries.get(role)
+        if entry is None or entry[0] != (key or get_role_model_key(role)):
+            return None
+        return entry[1]
+
+    def put(self, model, key=None):
+        self.entries[model.name] = (key or get_role_model_key(model.name), model)
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        with open(self.file_path, "wb") as f:
+            pickle.dump({"version": ROLE_MODEL_VERSION, "roles": self.entries}, f)
+        self.changed = False
+
+
+def get_application_roles():
+    return sorted(
+        role
+        for role in os.listdir(ROLES_DIRECTORY)
+        if role not in NON_APPLICATION_ROLES
+        and os.path.isdir(f"{ROLES_DIRECTORY}/{role}")
+    )
+
+
+def load_role_model(role, cache=None):
+    # Model of a role, from the cache if its files haven't changed
+    key = get_role_model_key(role)
+    model = cache.get(role, key) if cache is not None else None
+    if model is None:
+        model = build_role_model(role)
+        if cache is not None:
+            cache.put(model, key)
+    return model
+
+
+def load_role_models(roles=None, save=True):
+    # Map of role -> model, for every application role by default.
+    # With save=False the cache is only read, models of roles that changed are built but not written back
+    cache = RoleModelCache()
+    models = {
+        role: load_role_model(role, cache)
+        for role in (roles if roles is not None else get_application_roles())
+    }
+    if save:
+        cache.save()
+    return models
@@ -0,0 +1,293 @@
+# This script measures how long the playbook itself takes to run, without needing a real host.
+#
+# Usage: python benchmark.py [--roles N | --roles sonarr,radarr] [--runs N] [--keep]
+#
+# The playbook is run against localhost with a fake Docker daemon and `docker` CLI (see fake_docker.py),
+# which answer instantly, so only the time spent by Ansible and the project's own plugins is measured.
+# The project is copied to a temporary directory first, so the real state/ directory is never touched.
+# The first run starts every container, later runs show how long a run takes when nothing changed.
+#
+# For each run it shows the run time, number of tasks, module runs and Docker API requests, and the same per role.
+# A summary of each run is added to tests/.benchmark_history.csv, to compare runs over time.
+
+import argparse
+import bisect
+import csv
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+
+# Change working directory to project root
+dirname = os.path.dirname(os.path.realpath(__file__))
+os.chdir(dirname + "/..")
+
+BENCHMARK_HISTORY_FILE_PATH = "./tests/.benchmark_history.csv"
+# Parts of the project the playbook needs
+PROJECT_FILES = [
+    "ansible.cfg",
+    "playbook.yml",
+    "personal_playbook.yml",
+    "group_vars",
+    "roles",
+    "action_plugins",
+    "callback_plugins",
+    "library",
+    "scripts",
+]
+
+
+def get_applications():
+    # Every application in playbook.yml, in the order they're set up
+    with open("./playbook.yml", "r") as f:
+        playbook = yaml.safe_load(f)
+    return [
+        application
+        for application_group in playbook[0]["vars"]["application_groups"]
+        for application in application_group["applications"]
+    ]
+
+
+def copy_project(benchmark_directory):
+    project_directory = f"{benchmark_directory}/project"
+    os.makedirs(f"{project_directory}/state")
+    for file in PROJECT_FILES:
+        if os.path.isdir(file):
+            shutil.copytree(
+                file,
+                f"{project_directory}/{file}",
+                symlinks=True,
+                ignore=shutil.ignore_patterns("__pycache__"),
+            )
+        else:
+            shutil.copy(file, f"{project_directory}/{file}")
+    # Breaking change checks read the project's git history
+    for command in [
+        ["git", "init", "-q"],
+        ["git", "add", "-A"],
+        ["git", "-c", "user.name=benchmark", "-c", "user.email=benchmark@localhost", "commit", "-q", "-m", "Benchmark"],
+    ]:
+        subprocess.run(command, cwd=project_directory, check=True)
+    return project_directory
+
+
+def write_inventory(benchmark_directory, applications):
+    inventory_directory = f"{benchmark_directory}/inventory"
+    os.makedirs(f"{inventory_directory}/group_vars")
+    with open(f"{inventory_directory}/inventory", "w") as f:
+        f.write("[homelab]\n")
+        f.write(
+            f"localhost ansible_connection=local ansible_python_interpreter={benchmark_directory}/bin/python\n"
+        )
+    group_vars = {
+        "docker_home": f"{benchmark_directory}/docker",
+        "data_home": f"{benchmark_directory}/data",
+    }
+    for application in applications:
+        group_vars[f"{application}_enabled"] = True
+    with open(f"{inventory_directory}/group_vars/homelab.yml", "w") as f:
+        yaml.safe_dump(group_vars, f)
+    return f"{inventory_directory}/inventory"
+
+
+def write_bin(benchmark_directory):
+    # `docker` runs the fake CLI, `python` records every module run before running it
+    bin_directory = f"{benchmark_directory}/bin"
+    os.makedirs(bin_directory)
+    with open(f"{bin_directory}/docker", "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{dirname}/fake_docker.py" cli "$@"\n')
+    with open(f"{bin_directory}/python", "w") as f:
+        f.write(
+            "#!/bin/sh\n"
+            f'echo "$(date +%s.%N) $(basename "$1")" >> "{benchmark_directory}/modules.log"\n'
+            f'exec "{sys.executable}" "$@"\n'
+        )
+    for file in ["docker", "python"]:
+        os.chmod(f"{bin_directory}/{file}", 0o755)
+    return bin_directory
+
+
+def read_lines(file_path):
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, "r") as f:
+        return f.read().splitlines()
+
+
+class PlaybookFailed(Exception):
+    def __init__(self, output, role):
+        super().__init__(f"Playbook failed in role '{role}'")
+        self.output = output
+        # Role of the task that failed
+        self.role = role
+
+
+def run_playbook(benchmark_directory, project_directory, inventory, env):
+    # Returns the time taken, the run profile, the module runs and the docker requests of one run
+    for log in ["modules.log", "docker_requests.log"]:
+        open(f"{benchmark_directory}/{log}", "w").close()
+    start = time.time()
+    result = subprocess.run(
+        ["ansible-playbook", "-i", inventory, "playbook.yml"],
+        cwd=project_directory,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    duration = time.time() - start
+    with open(f"{project_directory}/state/run_profile.json", "r") as f:
+        run_profile = json.load(f)
+    if result.returncode != 0:
+        raise PlaybookFailed(result.stdout, run_profile["tasks"][-1]["role"])
+    module_runs = [
+        line.split(" ", 1) for line in read_lines(f"{benchmark_directory}/modules.log")
+    ]
+    docker_requests = read_lines(f"{benchmark_directory}/docker_requests.log")
+    return duration, run_profile, module_runs, docker_requests
+
+
+def count_module_runs_by_role(run_profile, module_runs):
+    # Each module run belongs to the task that was running when it started
+    tasks = run_profile["tasks"]
+    task_starts = [task["started"] for task in tasks]
+    module_runs_by_role = dict()
+    for module_run_time, _ in module_runs:
+        position = bisect.bisect_right(task_starts, float(module_run_time) - run_profile["start_time"]) - 1
+        role = tasks[position]["role"] if position >= 0 else ""
+        module_runs_by_role[role] = module_runs_by_role.get(role, 0) + 1
+    return module_runs_by_role
+
+
+def print_run(run, duration, run_profile, module_runs, docker_requests):
+    tasks_by_role = dict()
+    for task in run_profile["tasks"]:
+        tasks_by_role[task["role"]] = tasks_by_role.get(task["role"], 0) + 1
+    module_runs_by_role = count_module_runs_by_role(run_profile, module_runs)
+
+    print()
+    print(f"Run {run}: {duration:.2f}s, {len(run_profile['tasks'])} tasks, {len(module_runs)} module runs, {len(docker_requests)} Docker API requests")
+    print(f"  {'Role':<40} {'Time':>9} {'Tasks':>6} {'Modules':>8}")
+    for role, role_duration in sorted(
+        run_profile["roles"].items(), key=lambda item: item[1], reverse=True
+    ):
+        print(
+            f"  {role or '(playbook)':<40} {role_duration:8.2f}s {tasks_by_role.get(role, 0):>6} {module_runs_by_role.get(role, 0):>8}"
+        )
+
+
+def save_history(applications, run, duration, run_profile, module_runs, docker_requests):
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    new_file = not os.path.exists(BENCHMARK_HISTORY_FILE_PATH)
+    with open(BENCHMARK_HISTORY_FILE_PATH, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(
+                ["date", "commit", "applications", "run", "duration", "tasks", "module_runs", "docker_requests"]
+            )
+        writer.writerow(
+            [
+                datetime.datetime.now().isoformat(timespec="seconds"),
+                commit,
+                len(applications),
+                run,
+                round(duration, 3),
+                len(run_profile["tasks"]),
+                len(module_runs),
+                len(docker_requests),
+            ]
+        )
+
+
+def run_benchmark(applications, runs, keep):
+    benchmark_directory = tempfile.mkdtemp(prefix="homelab_benchmark_")
+    daemon = None
+    try:
+        project_directory = copy_project(benchmark_directory)
+        inventory = write_inventory(benchmark_directory, applications)
+        bin_directory = write_bin(benchmark_directory)
+        socket_path = f"{benchmark_directory}/docker.sock"
+        daemon = subprocess.Popen(
+            [sys.executable, f"{dirname}/fake_docker.py", "daemon", socket_path, f"{benchmark_directory}/docker_requests.log"]
+        )
+        while not os.path.exists(socket_path):
+            time.sleep(0.05)
+        env = dict(
+            os.environ,
+            PATH=f"{bin_directory}:{os.environ.get('PATH', '')}",
+            DOCKER_HOST=f"unix://{socket_path}",
+            ANSIBLE_CONFIG=f"{project_directory}/ansible.cfg",
+        )
+
+        results = []
+        for run in range(1, runs + 1):
+            results.append(run_playbook(benchmark_directory, project_directory, inventory, env))
+        return results
+    finally:
+        if daemon is not None:
+            daemon.terminate()
+            daemon.wait()
+        if keep:
+            print(f"Benchmark files kept in {benchmark_directory}")
+        else:
+            shutil.rmtree(benchmark_directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the playbook against a fake Docker daemon")
+    parser.add_argument(
+        "--roles",
+        default="10",
+        help="Number of applications to enable, or a comma separated list of applications (default: 10)",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=2,
+        help="Number of times to run the playbook (default: 2)",
+    )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Keep the temporary directory, with the project copy, inventory and logs",
+    )
+    args = parser.parse_args()
+
+    if shutil.which("ansible-playbook") is None:
+        print("ansible-playbook not found, install Ansible and the requirements.yml collections first")
+        sys.exit(1)
+
+    # Applications that fail without being configured (e.g. given a device or password) are replaced by the next one
+    candidates = get_applications() if args.roles.isdigit() else args.roles.split(",")
+    application_count = int(args.roles) if args.roles.isdigit() else len(candidates)
+    while True:
+        applications = candidates[:application_count]
+        print(f"Benchmarking {len(applications)} applications: {', '.join(applications)}")
+        try:
+            results = run_benchmark(applications, args.runs, args.keep)
+            break
+        except PlaybookFailed as e:
+            if not args.roles.isdigit() or e.role not in applications:
+                print(e.output[-5000:])
+                print(e)
+                sys.exit(1)
+            print(f"{e.role} fails without being configured, benchmarking without it")
+            candidates.remove(e.role)
+
+    for run, (duration, run_profile, module_runs, docker_requests) in enumerate(results, 1):
+        print_run(run, duration, run_profile, module_runs, docker_requests)
+        save_history(applications, run, duration, run_profile, module_runs, docker_requests)
+    print()
+    print(f"Results added to {BENCHMARK_HISTORY_FILE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+# A stand-in for the Docker daemon and `docker` CLI, used by benchmark.py to run the playbook without a real host.
+# Every request is answered instantly from memory and recorded, containers and images are never actually run or pulled.
+#
+# Usage:
+#   Start the daemon (the playbook's modules use it through DOCKER_HOST=unix://[socket]):
+#     python fake_docker.py daemon [socket] [request log]
+#   Run the CLI (the playbook's image pulls run `docker pull` and `docker image inspect`), talks to the daemon in DOCKER_HOST:
+#     python fake_docker.py cli pull linuxserver/sonarr:latest
+
+import hashlib
+import http.client
+import json
+import os
+import re
+import socket
+import socketserver
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler
+
+API_VERSION = "1.43"
+CREATED = "2024-01-01T00:00:00.000000000Z"
+
+
+def fake_id(*parts):
+    return hashlib.sha256(":".join(parts).encode()).hexdigest()
+
+
+def split_image(image):
+    # "linuxserver/sonarr:latest" -> ("linuxserver/sonarr", "latest")
+    name, _, tag = image.rpartition(":")
+    if not name or "/" in tag:
+        return image, "latest"
+    return name, tag
+
+
+class FakeDocker:
+    # Containers, images and networks of the fake daemon
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.containers = dict()  # id -> inspect data
+        self.images = dict()  # "name:tag" -> inspect data
+        self.networks = dict()  # id -> inspect data
+
+    def find_container(self, name_or_id):
+        for container in self.containers.values():
+            if container["Id"].startswith(name_or_id) or container["Name"] == f"/{name_or_id}":
+                return container
+        return None
+
+    def find_network(self, name_or_id):
+        for network in self.networks.values():
+            if network["Id"].startswith(name_or_id) or network["Name"] == name_or_id:
+                return network
+        return None
+
+    def pull_image(self, image):
+        name, tag = split_image(image)
+        image = f"{name}:{tag}"
+        if image not in self.images:
+            image_id = f"sha256:{fake_id('image', image)}"
+            self.images[image] = {
+                "Id": image_id,
+                "RepoTags": [image],
+                "RepoDigests": [f"{name}@sha256:{fake_id('digest', image)}"],
+                "Created": CREATED,
+                "Size": 0,
+                "Os": "linux",
+                "Architecture": "amd64",
+                "Config": {
+                    "Env": [],
+                    "Cmd": None,
+                    "Entrypoint": None,
+                    "ExposedPorts": None,
+                    "Volumes": None,
+                    "Labels": None,
+                    "WorkingDir": "",
+                    "User": "",
+                    "Healthcheck": None,
+                },
+            }
+        return self.images[image]
+
+    def create_container(self, name, body):
+        image = self.images.get("%s:%s" % split_image(body.get("Image", "")))
+        if image is None:
+            return None
+        container_id = fake_id("container", name, str(len(self.containers)))
+        host_config = body.pop("HostConfig", None) or {}
+        networking_config = body.pop("NetworkingConfig", None) or {}
+        network_mode = host_config.get("NetworkMode") or "default"
+        networks = dict()
+        for network_name, endpoint in (networking_config.get("EndpointsConfig") or {}).items():
+            networks[network_name] = self.network_endpoint(network_name, endpoint)
+        if not networks and network_mode not in ("host", "none") and not network_mode.startswith("container:"):
+            networks["bridge" if network_mode == "default" else network_mode] = self.network_endpoint(
+                network_mode, {}
+            )
+        self.containers[container_id] = {
+            "Id": container_id,
+            "Name": f"/{name}",
+            "Created": CREATED,
+            "Image": image["Id"],
+            "Path": "",
+            "Args": [],
+            "State": {
+                "Status": "created",
+                "Running": False,
+                "Paused": False,
+                "Restarting": False,
+                "OOMKilled": False,
+                "Dead": False,
+                "Pid": 0,
+                "ExitCode": 0,
+                "Error": "",
+                "StartedAt": CREATED,
+                "FinishedAt": CREATED,
+            },
+            "Config": body,
+            "HostConfig": host_config,
+            "NetworkSettings": {"Networks": networks, "Ports": {}},
+            "Mounts": [
+                {
+                    "Type": "bind",
+                    "Source": bind.split(":")[0],
+                    "Destination": bind.split(":")[1],
+                    "Mode": bind.split(":")[2] if bind.count(":") > 1 else "",
+                    "RW": not bind.endswith(":ro"),
+                }
+                for bind in host_config.get("Binds") or []
+            ],
+            "RestartCount": 0,
+            "Driver": "overlay2",
+            "Platform": "linux",
+            "MountLabel": "",
+            "ProcessLabel": "",
+            "AppArmorProfile": "",
+            "ExecIDs": None,
+            "GraphDriver": {"Name": "overlay2", "Data": None},
+        }
+        return container_id
+
+    def network_endpoint(self, network_name, endpoint):
+        network = self.find_network(network_name)
+        return {
+            "IPAMConfig": endpoint.get("IPAMConfig"),
+            "Links": endpoint.get("Links"),
+            "Aliases": endpoint.get("Aliases"),
+            "NetworkID": network["Id"] if network else fake_id("network", network_name),
+            "EndpointID": fake_id("endpoint", network_name),
+            "Gateway": "",
+            "IPAddress": "",
+            "MacAddress": "",
+        }
+
+    def list_container(self, container):
+        name = container["Name"][1:]
+        image = next(
+            (tag for tag, image in self.images.items() if image["Id"] == container["Image"]),
+            container["Config"].get("Image", ""),
+        )
+        return {
+            "Id": container["Id"],
+            "Names": [f"/{name}"],
+            "Image": image,
+            "ImageID": container["Image"],
+            "Command": "",
+            "Created": 0,
+            "State": container["State"]["Status"],
+            "Status": "Up" if container["State"]["Running"] else "Exited (0)",
+            "Labels": container["Config"].get("Labels") or {},
+            "Ports": [],
+            "Mounts": container["Mounts"],
+            "NetworkSettings": {"Networks": container["NetworkSettings"]["Networks"]},
+            "HostConfig": {"NetworkMode": container["HostConfig"].get("NetworkMode", "default")},
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, data=None, status=200, content_type="application/json"):
+        if data is None:
+            body = b""
+        elif isinstance(data, bytes):
+            body = data
+        else:
+            body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def reply_stream(self, lines):
+        # Streamed responses (e.g. pulls) are JSON objects sent as separate chunks
+        self.send_response(200)
+        self.send_header("Api-Version", API_VERSION)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            chunk = json.dumps(line).encode() + b"\r\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def not_found(self, message):
+        self.reply({"message": message}, 404)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def handle_request(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(re.sub(r"^/v[0-9.]+", "", url.path))
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.read_body() if self.command == "POST" else {}
+        with open(self.server.request_log, "a") as f:
+            f.write(f"{self.command} {path}\n")
+        with self.server.docker.lock:
+            self.route(self.server.docker, self.command, path, query, body)
+
+    do_GET = do_POST = do_DELETE = do_HEAD = handle_request
+
+    def route(self, docker, method, path, query, body):
+        if path == "/_ping":
+            return self.reply(b"OK", content_type="text/plain")
+        if path == "/version":
+            return self.reply(
+                {
+                    "Version": "24.0.0",
+                    "ApiVersion": API_VERSION,
+                    "MinAPIVersion": "1.12",
+                    "Os": "linux",
+                    "Arch": "amd64",
+                }
+            )
+        if path == "/info":
+            return self.reply(
+                {
+                    "ID": "fake",
+                    "Containers": len(docker.containers),
+                    "Images": len(docker.images),
+                    "Swarm": {"LocalNodeState": "inactive"},
+                }
+            )
+
+        # Containers
+        if path == "/containers/json":
+            return self.reply(
+                [
+                    docker.list_container(container)
+                    for container in docker.containers.values()
+                    if query.get("all") in ("1", "true") or container["State"]["Running"]
+                ]
+            )
+        if path == "/containers/create":
+            container_id = docker.create_container(query.get("name", ""), body)
+            if container_id is None:
+                return self.not_found(f"No such image: {body.get('Image')}")
+            return self.reply({"Id": container_id, "Warnings": []}, 201)
+        match = re.match(r"^/containers/([^/]+)(/[a-z]+)?$", path)
+        if match:
+            container = docker.find_container(match.group(1))
+            if container is None:
+                return self.not_found(f"No such container: {match.group(1)}")
+            action = match.group(2)
+            if action == "/json":
+                return self.reply(container)
+            if action in ("/start", "/restart", "/unpause"):
+                container["State"].update(Status="running", Running=True, Pid=1)
+                return self.reply(status=204)
+            if action in ("/stop", "/kill"):
+                container["State"].update(Status="exited", Running=False, Pid=0)
+                return self.reply(status=204)
+            if action == "/update":
+                container["HostConfig"].update(body)
+                return self.reply({"Warnings": []})
+            if action == "/rename":
+                container["Name"] = f"/{query.get('name', '')}"
+                return self.reply(status=204)
+            if action == "/wait":
+                return self.reply({"StatusCode": 0})
+            if action is None and method == "DELETE":
+                del docker.containers[container["Id"]]
+                return self.reply(status=204)
+
+        # Images
+        if path == "/images/json":
+            return self.reply(
+                [
+                    {key: image[key] for key in ("Id", "RepoTags", "RepoDigests", "Created", "Size")}
+                    for image in docker.images.values()
+                ]
+            )
+        if path == "/images/create":
+            image = docker.pull_image(f"{query.get('fromImage', '')}:{query.get('tag', 'latest')}")
+            digest = image["RepoDigests"][0].split("@")[1]
+            lines = [
+                {"status": f"Pulling from {query.get('fromImage')}", "id": query.get("tag", "latest")},
+                {"status": f"Digest: {digest}"},
+                {"status": f"Status: Image is up to date for {image['RepoTags'][0]}"},
+            ]
+            return self.reply_stream(lines)
+        match = re.match(r"^/images/(.+)/json$", path)
+        if match:
+            name, tag = split_image(match.group(1))
+            image = docker.images.get(f"{name}:{tag}")
+            if image is None:
+                image = next(
+                    (image for image in docker.images.values() if image["Id"] == match.group(1)), None
+                )
+            if image is None:
+                return self.not_found(f"No such image: {match.group(1)}")
+            return self.reply(image)
+
+        # Networks
+        if path == "/networks":
+            return self.reply(list(docker.networks.values()))
+        if path == "/networks/create":
+            network_id = fake_id("network", body.get("Name", ""))
+            docker.networks[network_id] = {
+                "Name": body.get("Name", ""),
+                "Id": network_id,
+                "Created": CREATED,
+                "Scope": "local",
+                "Driver": body.get("Driver") or "bridge",
+                "EnableIPv6": False,
+                "IPAM": {"Driver": "default", "Options": None, "Config": []},
+                "Internal": False,
+                "Attachable": False,
+                "Ingress": False,
+                "Containers": {},
+                "Options": body.get("Options") or {},
+                "Labels": body.get("Labels") or {},
+            }
+            return self.reply({"Id": network_id, "Warning": ""}, 201)
+        match = re.match(r"^/networks/([^/]+)(/[a-z]+)?$", path)
+        if match:
+            network = docker.find_network(match.group(1))
+            if network is None:
+                return self.not_found(f"network {match.group(1)} not found")
+            action = match.group(2)
+            if action is None and method == "GET":
+                return self.reply(network)
+            if action is None and method == "DELETE":
+                del docker.networks[network["Id"]]
+                return self.reply(status=204)
+            if action in ("/connect", "/disconnect"):
+                container = docker.find_container(body.get("Container", ""))
+                if container is not None:
+                    networks = container["NetworkSettings"]["Networks"]
+                    if action == "/connect":
+                        networks[network["Name"]] = docker.network_endpoint(
+                            network["Name"], body.get("EndpointConfig") or {}
+                        )
+                    else:
+                        networks.pop(network["Name"], None)
+                return self.reply(status=200)
+
+        return self.not_found(f"{method} {path} is not supported by the fake Docker daemon")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ("localhost", 0)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def run_daemon(socket_path, request_log):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = UnixHTTPServer(socket_path, RequestHandler)
+    server.docker = FakeDocker()
+    server.request_log = request_log
+    server.serve_forever()
+
+
+def request(method, path):
+    socket_path = os.environ.get("DOCKER_HOST", "").replace("unix://", "", 1)
+    connection = UnixHTTPConnection(socket_path)
+    connection.request(method, f"/v{API_VERSION}{path}", body=b"" if method == "POST" else None)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def run_cli(args):
+    # Only the commands the playbook runs
+    if args[:1] == ["pull"]:
+        name, tag = split_image(args[1])
+        status, body = request(
+            "POST", f"/images/create?fromImage={urllib.parse.quote(name)}&tag={urllib.parse.quote(tag)}"
+        )
+        for line in body.decode().splitlines():
+            print(json.loads(line)["status"])
+        return 0 if status == 200 else 1
+    if args[:2] == ["image", "inspect"]:
+        status, body = request("GET", f"/images/{urllib.parse.quote(args[-1], safe='')}/json")
+        if status != 200:
+            print(f"Error: No such image: {args[-1]}", file=sys.stderr)
+            return 1
+        print(json.loads(body)["Id"])
+        return 0
+    print(f"fake docker: unsupported command {' '.join(args)}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["daemon"]:
+        run_daemon(sys.argv[2], sys.argv[3])
+    elif sys.argv[1:2] == ["cli"]:
+        sys.exit(run_cli(sys.argv[2:]))
+    else:
+        print("Usage: python fake_docker.py daemon [socket] [request log] | cli [args]")
+        sys.exit(1)
@@ -0,0 +1,916 @@
+# Rules test.py checks every role against.
+#
+# Each rule is a function registered with one of these decorators, in the order their results are shown:
+#
+#   @role_rule("defaults")   Runs once per role. The parts of the role it needs are given, and it's only run
+#                            when the role has all of them:
+#                              "defaults": defaults/main.yml could be parsed
+#                              "tasks":    tasks/main.yml could be parsed
+#                              "docs":     the role has a documentation file
+#                            It adds its own results, with context.result.add_fail/add_result/add_skip.
+#
+#   @task_rule(block="start", action=DOCKER_CONTAINER_ACTION, container=True)
+#                            Runs on each task of the start or stop block (both with "any") with the given action (any
+#                            action if not given), or on the task's container if `container` is set. The tasks of a role
+#                            are only walked once, and each task is handed to every rule that wants it.
+#                            Returns True if the task passes, False if it fails (after adding its fails), or None
+#                            if the rule doesn't apply to it. The rule passes if every task it applied to passed,
+#                            and is skipped if it applied to none (or passes, with `without_tasks="pass"`).
+#
+# Role rules that need "tasks" run after task rules, every other role rule runs before them.
+# How long each rule took is recorded in context.rule_times, see `test.py --profile`.
+
+import os
+import re
+import time
+
+from role_model import DOCKER_CONTAINER_ACTION, DOCKER_CONTAINER_MODULE
+
+# Facts roles use, and the ansible.builtin.setup subset that gathers them.
+# Only the subsets listed in `<role>_gather_subset` are gathered
+FACT_SUBSETS = {
+    "default_ipv4": "network",
+    "default_ipv6": "network",
+    "all_ipv4_addresses": "network",
+    "all_ipv6_addresses": "network",
+    "interfaces": "network",
+    "memtotal_mb": "hardware",
+    "processor_vcpus": "hardware",
+    "mounts": "hardware",
+    "architecture": "platform",
+    "hostname": "platform",
+    "fqdn": "platform",
+    "distribution": "distribution",
+    "distribution_version": "distribution",
+    "date_time": "date_time",
+    "env": "env",
+    "dns": "dns",
+    "user_id": "user",
+}
+
+
+class Rule:
+    __slots__ = ("name", "check", "parts", "block", "action", "container", "without_tasks")
+
+    def __init__(self, check, parts=(), block=None, action=None, container=False, without_tasks="skip"):
+        self.name = check.__name__
+        self.check = check
+        self.parts = parts
+        # Task rules only
+        self.block = block
+        self.action = action
+        self.container = container
+        self.without_tasks = without_tasks
+
+
+RULES = []
+
+
+def role_rule(*parts):
+    def register(check):
+        RULES.append(Rule(check, parts))
+        return check
+
+    return register
+
+
+def task_rule(block="start", action=None, container=False, without_tasks="skip"):
+    def register(check):
+        RULES.append(Rule(check, ("tasks",), block, action, container, without_tasks))
+        return check
+
+    return register
+
+
+class RoleContext:
+    # Everything a rule can look at for a role, and where its results go
+
+    def __init__(self, role, playbook_role, model, result):
+        self.role = role
+        self.playbook_role = playbook_role
+        self.model = model
+        self.result = result
+        # Lines of the role's documentation file, None if it has none (or it's archived)
+        self.docs_lines = load_raw_file(f"./docs/src/content/docs/applications/{role}.mdx")
+        # Map of rule name -> seconds spent in it
+        self.rule_times = dict()
+
+    def has_parts(self, parts):
+        return (
+            ("defaults" not in parts or self.model.defaults is not None)
+            and ("tasks" not in parts or self.model.start_tasks is not None)
+            and ("docs" not in parts or self.docs_lines is not None)
+        )
+
+    def add_time(self, rule, seconds):
+        self.rule_times[rule.name] = self.rule_times.get(rule.name, 0) + seconds
+
+
+def load_raw_file(file_path):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r") as f:
+        try:
+            lines = f.readlines()
+            return lines
+        except Exception as e:
+            print(e)
+            return None
+
+
+def run_role_rule(context, rule):
+    start = time.perf_counter()
+    rule.check(context)
+    context.add_time(rule, time.perf_counter() - start)
+
+
+def run_task_rules(context, task_rules):
+    # Walk the tasks of the role once, handing each task to the rules that want it
+    model = context.model
+    containers = {
+        id(container.task): container
+        for container in model.containers + model.removed_containers
+    }
+    rules_by_block_and_action = dict()
+    for rule in task_rules:
+        rules_by_block_and_action.setdefault((rule.block, rule.action), []).append(rule)
+    outcomes = {rule.name: [] for rule in task_rules}
+
+    for block, tasks in (("start", model.start_tasks), ("stop", model.stop_tasks or [])):
+        rules_for_any_action = rules_by_block_and_action.get((block, None), []) + rules_by_block_and_action.get(
+            ("any", None), []
+        )
+        for task in tasks:
+            rules_for_action = rules_by_block_and_action.get((block, task.action), []) + rules_by_block_and_action.get(
+                ("any", task.action), []
+            )
+            for rule in rules_for_action + rules_for_any_action:
+                subject = task
+                if rule.container:
+                    subject = containers.get(id(task))
+                    if subject is None:
+                        continue
+                start = time.perf_counter()
+                passed = rule.check(context, subject)
+                context.add_time(rule, time.perf_counter() - start)
+                if passed is not None:
+                    outcomes[rule.name].append(passed)
+
+    for rule in task_rules:
+        if outcomes[rule.name]:
+            context.result.add_result(all(outcomes[rule.name]))
+        elif rule.without_tasks == "pass":
+            context.result.add_result(True)
+        else:
+            context.result.add_skip()
+
+
+def run_rules(context):
+    role_rules = [rule for rule in RULES if rule.block is None]
+    task_rules = [rule for rule in RULES if rule.block is not None]
+    for rule in role_rules:
+        if "tasks" not in rule.parts and context.has_parts(rule.parts):
+            run_role_rule(context, rule)
+    if context.has_parts(("tasks",)):
+        run_task_rules(context, task_rules)
+    for rule in role_rules:
+        if "tasks" in rule.parts and context.has_parts(rule.parts):
+            run_role_rule(context, rule)
+
+
+def find_label_line_number(containers, label):
+    # Line of a label in the first docker container task that sets it,
+    # otherwise the line of the first docker container task
+    for container in containers:
+        if label in container.labels:
+            return container.label_lines.get(label, -1)
+    return containers[0].task.line if containers else -1
+
+
+def find_name_line_number(containers_or_networks, name):
+    # Line of the `name` parameter of the first task creating or removing the container or network called name
+    for container_or_network in containers_or_networks:
+        if container_or_network.name == name:
+            return container_or_network.task.arg_lines.get("name", -1)
+    return -1
+
+
+def has_label(containers, label):
+    return any(label in container.labels for container in containers)
+
+
+def has_hostname(context):
+    return context.model.defaults is not None and f"{context.role}_hostname" in context.model.defaults
+
+
+#
+# General Role Tests
+#
+
+
+# Role must not have a dash in its name
+@role_rule()
+def role_name_has_no_dash(context):
+    test_passed = True
+    if "-" in context.role:
+        context.result.add_fail(
+            f"Role name `{context.role}` must not contain a dash (`-`). Consider removing or replacing with an underscore (`_`).",
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Role must be listed in the application groups of playbook.yml
+@role_rule()
+def role_is_in_playbook(context):
+    role = context.role
+    test_passed = True
+    if context.playbook_role is None:
+        context.result.add_fail(
+            f"Role '{role}' not found in playbook.yml. Add `- {role}` to the `applications` of a group in `application_groups` in playbook.yml",
+            "playbook.yml",
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Role defaults must be linked into the general role, since other roles may use them
+# and application roles are only loaded when they run
+@role_rule()
+def defaults_are_linked(context):
+    role = context.role
+    test_passed = True
+    defaults_link = f"./roles/ansible_homelab_orchestration_general/defaults/main/{role}.yml"
+    if not os.path.islink(defaults_link) or os.path.realpath(defaults_link) != os.path.realpath(
+        f"./roles/{role}/defaults/main.yml"
+    ):
+        context.result.add_fail(
+            f"Role defaults are not linked into the general role. Run `ln -s ../../../{role}/defaults/main.yml {defaults_link}`",
+            defaults_link,
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Facts the role uses must be gathered, by listing their subset in `<role>_gather_subset`
+@role_rule()
+def facts_are_gathered(context):
+    model = context.model
+    facts = {fact: location for fact, location in model.facts.items() if fact in FACT_SUBSETS}
+    if not facts:
+        context.result.add_skip()
+        return
+    test_passed = True
+    for fact, (file_path, line_number) in sorted(facts.items()):
+        if FACT_SUBSETS[fact] not in model.gather_subset:
+            context.result.add_fail(
+                f"Fact `ansible_{fact}` is used but `{FACT_SUBSETS[fact]}` is not listed in `{context.role}_gather_subset`",
+                f"{file_path}:{line_number}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Role must have a documentation file
+@role_rule()
+def documentation_exists(context):
+    role = context.role
+    doc_file_path = f"./docs/src/content/docs/applications/{role}.mdx"
+    test_passed = True
+    if not os.path.exists(doc_file_path):
+        # Maybe it's been archived?
+        archived_doc_file_path = f"./docs/src/content/docs/archived_applications/{role}.mdx"
+        if not os.path.exists(archived_doc_file_path):
+            context.result.add_fail(
+                f"Documentation file `{doc_file_path}` not found",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+#
+# Tests for Documentation file
+#
+
+
+# Documentation file must not have any placeholder links
+@role_rule("docs")
+def documentation_has_no_placeholder_links(context):
+    test_passed = True
+    for line_number, line in enumerate(context.docs_lines, start=1):
+        if line.startswith("[Repository]({/* REPLACE") or line.startswith(
+            "[Homepage]({/* REPLACE"
+        ):
+            context.result.add_fail(
+                f"Documentation file contains placeholder link: '{line.strip()}'",
+                f"docs/src/content/docs/applications/{context.role}.mdx:{line_number}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Documentation must not have a placeholder description
+@role_rule("docs")
+def documentation_has_no_placeholder_description(context):
+    test_passed = True
+    for line_number, line in enumerate(context.docs_lines, start=1):
+        if line.startswith("TODO: Add a short description"):
+            context.result.add_fail(
+                f"Documentation file contains placeholder description: '{line.strip()}'",
+                f"docs/src/content/docs/applications/{context.role}.mdx:{line_number}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+#
+# Tests for Defaults file
+#
+
+
+# Basic variable presence
+@role_rule("defaults")
+def required_variables_exist(context):
+    role = context.role
+    test_passed = True
+    # _dns_accessible and _available_externally only needed if _hostname exists
+    required_vars = ["enabled", "memory"]
+    for var in required_vars:
+        if f"{role}_{var}" not in context.model.defaults:
+            context.result.add_fail(
+                f"Required variable `{role}_{var}` not found in defaults/main.yml",
+                f"roles/{role}/defaults/main.yml",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# All port variables must end with _port
+@role_rule("defaults")
+def port_variables_end_with_port(context):
+    test_passed = True
+    for key in context.model.defaults.keys():
+        if "_port" in key and not key.endswith("_port"):
+            context.result.add_fail(
+                f"Port variable `{key}` must end with `_port`",
+                f"roles/{context.role}/defaults/main.yml:{context.model.default_line(key)}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# All directory variables must end with _directory
+@role_rule("defaults")
+def directory_variables_end_with_directory(context):
+    test_passed = True
+    for key in context.model.defaults.keys():
+        if "_directory" in key and not key.endswith("_directory"):
+            context.result.add_fail(
+                f"Directory variable `{key}` must end with `_directory`",
+                f"roles/{context.role}/defaults/main.yml:{context.model.default_line(key)}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# If hostname present, must have other related vars
+@role_rule("defaults")
+def hostname_variables_exist(context):
+    role = context.role
+    if not has_hostname(context):
+        context.result.add_skip()
+        return
+    test_passed = True
+    related_vars = ["dns_accessible", "available_externally"]
+    for var in related_vars:
+        if f"{role}_{var}" not in context.model.defaults:
+            context.result.add_fail(
+                f"`{role}_{var}` not found in defaults/main.yml while `{role}_hostname` is defined",
+                f"roles/{role}/defaults/main.yml",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# container_names_list exists as a list
+@role_rule("defaults")
+def container_names_is_a_list(context):
+    if not isinstance(context.model.container_names, list):
+        context.result.add_fail(
+            f"`{context.role}_container_names` is not a list in defaults/main.yml",
+            f"roles/{context.role}/defaults/main.yml",
+        )
+        context.result.add_result(False)
+
+
+# All container_names must be in container_names_list
+@role_rule("defaults")
+def container_names_are_listed(context):
+    model = context.model
+    if not isinstance(model.container_names, list):
+        context.result.add_skip(problem=True)
+        return
+    test_passed = True
+    for container_name in model.defaults:
+        if not container_name.endswith("_container_name"):
+            continue
+        if f"{{{{ {container_name} }}}}" not in model.container_names:
+            context.result.add_fail(
+                f"Container `{container_name}` not found in `{context.role}_container_names`",
+                f"roles/{context.role}/defaults/main.yml:{model.default_line(container_name)}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# There must not be any container_names_list not in container_names
+@role_rule("defaults")
+def listed_container_names_exist(context):
+    model = context.model
+    if not isinstance(model.container_names, list):
+        context.result.add_skip(problem=True)
+        return
+    test_passed = True
+    for container_name in model.container_names:
+        stripped_name = container_name.replace("{{ ", "").replace(" }}", "")
+        if not (stripped_name.endswith("_container_name") and stripped_name in model.defaults):
+            context.result.add_fail(
+                f"Container `{stripped_name}` listed in `{context.role}_container_names` but no matching variable found",
+                f"roles/{context.role}/defaults/main.yml:{model.default_item_line(f'{context.role}_container_names', container_name)}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+#
+# Tests for Task file
+#
+
+
+# First task must be checking for Breaking Changes role
+@role_rule("tasks")
+def first_task_checks_breaking_changes(context):
+    first_task = context.model.start_tasks[0]
+    test_passed = True
+    if first_task.action != "breaking_changes":
+        context.result.add_fail(
+            "First task in block must be the 'breaking_changes' action",
+            f"roles/{context.role}/tasks/main.yml:{first_task.line}",
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# First task name must match pattern
+@role_rule("tasks")
+def breaking_changes_task_name(context):
+    first_task = context.model.start_tasks[0]
+    if first_task.action != "breaking_changes":
+        context.result.add_skip(problem=True)
+        return
+    test_passed = True
+    breaking_changes_pattern = re.compile(
+        "^Check for [a-z0-9. _-]+ Breaking Changes$", re.IGNORECASE
+    )
+    if breaking_changes_pattern.match(first_task.name) is None:
+        context.result.add_fail(
+            "Name of first task in block must Match 'Check for [app] Breaking Changes'",
+            f"roles/{context.role}/tasks/main.yml:{first_task.line}",
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# First task must check current role for breaking changes
+@role_rule("tasks")
+def breaking_changes_task_application(context):
+    role = context.role
+    first_task = context.model.start_tasks[0]
+    if first_task.action != "breaking_changes":
+        context.result.add_skip(problem=True)
+        return
+    test_passed = True
+    if first_task.args.get("application", "") != role:
+        context.result.add_fail(
+            f"First task in block must set 'breaking_changes' application to current role name ({role})",
+            f"roles/{role}/tasks/main.yml:{first_task.line}",
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Docker containers must be created and removed with the cached action, so unchanged containers are skipped
+# and containers can be removed in the background
+@task_rule(block="any", action=DOCKER_CONTAINER_MODULE, without_tasks="pass")
+def containers_use_cached_action(context, task):
+    context.result.add_fail(
+        f"Docker container task '{task.name}' must use `{DOCKER_CONTAINER_ACTION}` instead of `{DOCKER_CONTAINER_MODULE}`",
+        f"roles/{context.role}/tasks/main.yml:{task.line}",
+    )
+    return False
+
+
+# Each docker container task must have a variable name
+@task_rule(action=DOCKER_CONTAINER_ACTION, container=True)
+def container_name_is_variable(context, container):
+    if not container.name.startswith(f"{{{{ {context.role}_"):
+        context.result.add_fail(
+            f"Docker container task '{container.task.name}' does not have a variable container name",
+            f"roles/{context.role}/tasks/main.yml:{container.task.line}",
+        )
+        return False
+    return True
+
+
+# Each docker container task must have a variable image and tag
+@task_rule(action=DOCKER_CONTAINER_ACTION, container=True)
+def container_image_is_variable(context, container):
+    role = context.role
+    image_and_tag_pattern = re.compile(
+        "^{{\\s*" + role + "[a-z_]+\\s*}}:{{\\s*" + role + "[a-z_]+\\s*}}"
+    )
+    if not image_and_tag_pattern.match(container.image):
+        context.result.add_fail(
+            f"Docker container task '{container.task.name}' does not have a variable image and tag",
+            f"roles/{role}/tasks/main.yml:{container.task.line}",
+        )
+        return False
+    return True
+
+
+# Tasks run in the background must only be followed by other tasks run in the background in their block,
+# since nothing after them waits for them, and must only run in the background when the playbook starts
+# containers at the same time
+@task_rule(block="any", without_tasks="pass")
+def background_tasks_are_last(context, task):
+    if "poll" not in task.keywords:
+        return None
+    test_passed = True
+    tasks = context.model.start_tasks if task in context.model.start_tasks else context.model.stop_tasks
+    if any("poll" not in later_task.keywords for later_task in tasks[tasks.index(task) + 1 :]):
+        context.result.add_fail(
+            f"Task '{task.name}' runs in the background (`poll: 0`) but is followed by a task that doesn't, which would run before it's done",
+            f"roles/{context.role}/tasks/main.yml:{task.key_lines.get('poll', -1)}",
+        )
+        test_passed = False
+    if task.keywords.get("async") != "{{ docker_container_async | default(0) }}":
+        context.result.add_fail(
+            f"Task '{task.name}' runs in the background (`poll: 0`) but doesn't set `async: \"{{{{ docker_container_async | default(0) }}}}\"`",
+            f"roles/{context.role}/tasks/main.yml:{task.line}",
+        )
+        test_passed = False
+    return test_passed
+
+
+# Each docker container task that pulls its image must have it pulled before applications are set up
+@task_rule(action=DOCKER_CONTAINER_ACTION, container=True)
+def container_images_are_prepulled(context, container):
+    role = context.role
+    if container.pull is None:
+        return None
+    test_passed = True
+    if container.pull != "{{ docker_container_pull | default('always') }}":
+        context.result.add_fail(
+            f"Docker container task '{container.task.name}' does not pull its image with `{{{{ docker_container_pull | default('always') }}}}`",
+            f"roles/{role}/tasks/main.yml:{container.task.arg_lines.get('pull', -1)}",
+        )
+        test_passed = False
+    container_images = context.model.container_images
+    if not isinstance(container_images, list) or container.image not in container_images:
+        context.result.add_fail(
+            f"Docker container task '{container.task.name}' image is not listed in `{role}_container_images`",
+            f"roles/{role}/tasks/main.yml:{container.task.line}",
+        )
+        test_passed = False
+    return test_passed
+
+
+# Each docker container task must have a restart policy of unless-stopped
+@task_rule(action=DOCKER_CONTAINER_ACTION, container=True)
+def container_restart_policy(context, container):
+    if container.restart_policy != "unless-stopped":
+        context.result.add_fail(
+            f"Docker container task '{container.task.name}' does not have a restart policy of 'unless-stopped'",
+            f"roles/{context.role}/tasks/main.yml:{container.task.line}",
+        )
+        return False
+    return True
+
+
+# Each docker container task must have a memory limit
+@task_rule(action=DOCKER_CONTAINER_ACTION, container=True)
+def container_memory_limit(context, container):
+    if container.memory is None:
+        context.result.add_fail(
+            f"Docker container task '{container.task.name}' does not have a memory limit set",
+            f"roles/{context.role}/tasks/main.yml:{container.task.line}",
+        )
+        return False
+    return True
+
+
+# Directories must be listed in `<role>_directories`, so they can be created before any application is set up
+@task_rule(action="ansible.builtin.file", without_tasks="pass")
+def directories_are_not_created_with_file(context, task):
+    if task.args.get("state", "") != "directory":
+        return None
+    context.result.add_fail(
+        f"Directories must be listed in `{context.role}_directories` instead of being created with `ansible.builtin.file`",
+        f"roles/{context.role}/tasks/main.yml:{task.line}",
+    )
+    return False
+
+
+# If hostname is set, at least one docker container must have traefik labels
+@role_rule("tasks")
+def traefik_labels_exist(context):
+    containers = context.model.containers
+    if not has_hostname(context):
+        context.result.add_skip()
+    elif not containers:
+        context.result.add_skip(problem=True)
+    else:
+        test_passed = has_label(containers, "traefik.enable")
+        if not test_passed:
+            context.result.add_fail(
+                f"No docker container task has traefik labels set while hostname is defined",
+                "tasksroles/{role}//main.yml",
+            )
+        context.result.add_result(test_passed)
+
+
+# If hostname is set, the traefik.enable label must be set correctly
+@role_rule("tasks")
+def traefik_enable_label(context):
+    role = context.role
+    containers = context.model.containers
+    if not has_hostname(context):
+        context.result.add_skip()
+    elif not containers or not has_label(containers, "traefik.enable"):
+        context.result.add_skip(problem=True)
+    else:
+        test_passed = any(
+            container.labels.get("traefik.enable", "")
+            == "{{ (" + role + "_dns_accessible or " + role + "_available_externally) | string }}"
+            for container in containers
+        )
+        if not test_passed:
+            context.result.add_fail(
+                f"`traefik.enable` label not set correctly. Should be `{{{{ ({role}_dns_accessible or {role}_available_externally) | string }}}}`",
+                f"roles/{role}/tasks/main.yml:{find_label_line_number(containers, 'traefik.enable')}",
+            )
+        context.result.add_result(test_passed)
+
+
+# If hostname is set, the traefik loadbalancer label must be named correctly
+@role_rule("tasks")
+def traefik_loadbalancer_label_name(context):
+    role = context.role
+    containers = context.model.containers
+    if not has_hostname(context):
+        context.result.add_skip()
+    elif not containers or not has_label(containers, "traefik.enable"):
+        context.result.add_skip(problem=True)
+    else:
+        test_passed = has_label(containers, f"traefik.http.services.{role}.loadbalancer.server.port")
+        if not test_passed:
+            context.result.add_fail(
+                f"traefik loadbalancer label does not exist or isn't named correctly. Should be `traefik.http.services.{role}.loadbalancer.server.port`",
+                f"roles/{role}/tasks/main.yml:{find_label_line_number(containers, 'traefik.enable')}",
+            )
+        context.result.add_result(test_passed)
+
+
+# If hostname is set, the traefik loadbalancer label must match a port forwarded on the app
+@role_rule("tasks")
+def traefik_loadbalancer_label_port(context):
+    role = context.role
+    containers = context.model.containers
+    loadbalancer_label = f"traefik.http.services.{role}.loadbalancer.server.port"
+    if not has_hostname(context):
+        context.result.add_skip()
+        return
+    if (
+        not containers
+        or not has_label(containers, "traefik.enable")
+        or not has_label(containers, loadbalancer_label)
+    ):
+        context.result.add_skip(problem=True)
+        return
+    test_passed = False
+    for container in containers:
+        if container.network_mode == "host":
+            # Host mode containers don't have mapped ports, we can't check it
+            context.result.add_skip()
+            return
+        internal_ports = [
+            (
+                port.split(":")[1].replace("/tcp", "").replace("/udp", "")
+                if ":" in port
+                else port
+            )
+            for port in container.ports
+        ]
+        if container.labels.get(loadbalancer_label, "") in internal_ports:
+            test_passed = True
+    if not test_passed:
+        context.result.add_fail(
+            f"`{loadbalancer_label}` label not set correctly. Should be one of the forwarded internal ports: {internal_ports}",
+            f"roles/{role}/tasks/main.yml:{find_label_line_number(containers, loadbalancer_label)}",
+        )
+    context.result.add_result(test_passed)
+
+
+# If hostname is set, the traefik middlewares label must be named correctly
+@role_rule("tasks")
+def traefik_middlewares_label_name(context):
+    role = context.role
+    containers = context.model.containers
+    if not has_hostname(context):
+        context.result.add_skip()
+    elif not containers or not has_label(containers, "traefik.enable"):
+        context.result.add_skip(problem=True)
+    else:
+        test_passed = has_label(containers, f"traefik.http.routers.{role}.middlewares")
+        if not test_passed:
+            context.result.add_fail(
+                f"traefik middlewares label does not exist or isn't named correctly. Should be `traefik.http.routers.{role}.middlewares`",
+                f"roles/{role}/tasks/main.yml:{find_label_line_number(containers, 'traefik.enable')}",
+            )
+        context.result.add_result(test_passed)
+
+
+# If hostname is set, the traefik middlewares label must be set correctly
+@role_rule("tasks")
+def traefik_middlewares_label(context):
+    role = context.role
+    containers = context.model.containers
+    middlewares_label = f"traefik.http.routers.{role}.middlewares"
+    if not has_hostname(context):
+        context.result.add_skip()
+    elif (
+        not containers
+        or not has_label(containers, "traefik.enable")
+        or not has_label(containers, middlewares_label)
+    ):
+        context.result.add_skip(problem=True)
+    else:
+        test_passed = any(
+            container.labels.get(middlewares_label, "")
+            == "{{ omit if " + role + "_available_externally else 'blockExternal@file' }}"
+            for container in containers
+        )
+        if not test_passed:
+            context.result.add_fail(
+                f"`{middlewares_label}` label not set correctly. Should be `{{{{ omit if {role}_available_externally else 'blockExternal@file' }}}}`",
+                f"roles/{role}/tasks/main.yml:{find_label_line_number(containers, middlewares_label)}",
+            )
+        context.result.add_result(test_passed)
+
+
+# All directory variables must be created, by listing them in `<role>_directories`
+@role_rule("defaults", "tasks")
+def directory_variables_are_listed(context):
+    model = context.model
+    if not model.directory_variables:
+        context.result.add_skip()
+        return
+    test_passed = True
+    directory_paths = [
+        str(directory.get("path", "")) if isinstance(directory, dict) else str(directory)
+        for directory in (model.directories if isinstance(model.directories, list) else [])
+    ]
+    for directory_var in model.directory_variables:
+        directory_var_as_var = f"{{{{ {directory_var} }}}}"
+        if not any(
+            directory_path.startswith(directory_var_as_var)
+            for directory_path in directory_paths
+        ):
+            context.result.add_fail(
+                f"Directory variable `{directory_var}` is not listed in `{context.role}_directories`",
+                f"roles/{context.role}/defaults/main.yml:{model.default_line(directory_var)}",
+            )
+            test_passed = False
+    context.result.add_result(test_passed)
+
+
+# Directories must be created with create_directories, so they can be created before any application is set up
+@role_rule("defaults", "tasks")
+def directories_are_created(context):
+    role = context.role
+    model = context.model
+    if model.directories is None:
+        context.result.add_skip()
+        return
+    test_passed = True
+    if not any(
+        task.action == "create_directories"
+        and task.args.get("directories", "") == f"{{{{ {role}_directories }}}}"
+        for task in model.start_tasks
+    ):
+        context.result.add_fail(
+            f"`{role}_directories` must be created in a task with `create_directories: directories: \"{{{{ {role}_directories }}}}\"`",
+            f"roles/{role}/defaults/main.yml:{model.default_line(f'{role}_directories')}",
+        )
+        test_passed = False
+    context.result.add_result(test_passed)
+
+
+# All docker containers listed in container_names_list must be created
+@role_rule("tasks")
+def listed_containers_are_created(context):
+    model = context.model
+    if not isinstance(model.container_names, list):
+        context.result.add_skip()
+    elif not model.containers:
+        context.result.add_skip(problem=True)
+    else:
+        test_passed = True
+        created_containers = set(container.name for container in model.containers)
+        for container_name in model.container_names:
+            if container_name in created_containers:
+                continue
+            container_var_name = container_name.replace("{{ ", "").replace(" }}", "")
+            container_actual_name = model.defaults.get(container_var_name, container_var_name)
+            context.result.add_fail(
+                f"Docker container `{container_name}` ({container_actual_name}) listed in `{context.role}_container_names` but no matching docker container created in tasks",
+                f"roles/{context.role}/defaults/main.yml:{model.default_item_line(f'{context.role}_container_names', container_name)}",
+            )
+            test_passed = False
+        context.result.add_result(test_passed)
+
+
+# All created containers must get removed
+@role_rule("tasks")
+def created_containers_are_removed(context):
+    model = context.model
+    if not isinstance(model.container_names, list):
+        context.result.add_skip()
+    elif not model.containers:
+        context.result.add_skip(problem=True)
+    else:
+        created_containers = set(container.name for container in model.containers)
+        created_containers -= set(container.name for container in model.removed_containers)
+        test_passed = not created_containers
+        if created_containers:
+            container_var_names = [
+                name.replace("{{ ", "").replace(" }}", "") for name in created_containers
+            ]
+            container_actual_names = [
+                model.defaults.get(var_name, var_name) for var_name in container_var_names
+            ]
+            context.result.add_fail(
+                f"Not all containers created are removed in stop tasks. Remaining: {created_containers} ({container_actual_names})",
+                f"roles/{context.role}/tasks/main.yml:{find_name_line_number(model.containers, created_containers.pop())}",
+            )
+        context.result.add_result(test_passed)
+
+
+# Only created containers should get removed
+@role_rule("tasks")
+def only_created_containers_are_removed(context):
+    model = context.model
+    if not isinstance(model.container_names, list):
+        context.result.add_skip()
+    elif not model.containers:
+        context.result.add_skip(problem=True)
+    else:
+        removed_containers = set(container.name for container in model.removed_containers)
+        removed_containers -= set(container.name for container in model.containers)
+        test_passed = not removed_containers
+        if removed_containers:
+            container_var_names = [
+                name.replace("{{ ", "").replace(" }}", "") for name in removed_containers
+            ]
+            container_actual_names = [
+                model.defaults.get(var_name, var_name) for var_name in container_var_names
+            ]
+            context.result.add_fail(
+                f"Some containers are removed that aren't created by this role: {removed_containers} ({container_actual_names})",
+                f"roles/{context.role}/tasks/main.yml:{find_name_line_number(model.removed_containers, removed_containers.pop())}",
+            )
+        context.result.add_result(test_passed)
+
+
+# Any created networks must be removed
+@role_rule("tasks")
+def created_networks_are_removed(context):
+    model = context.model
+    if not model.networks:
+        context.result.add_skip()
+        return
+    created_networks = set(network.name for network in model.networks)
+    created_networks -= set(network.name for network in model.removed_networks)
+    test_passed = not created_networks
+    if created_networks:
+        network_var_names = [
+            name.replace("{{ ", "").replace(" }}", "") for name in created_networks
+        ]
+        network_actual_names = [
+            (model.defaults or {}).get(var_name, var_name) for var_name in network_var_names
+        ]
+        context.result.add_fail(
+            f"Not all networks created are removed in stop tasks. Remaining: {created_networks} ({network_actual_names})",
+            f"roles/{context.role}/tasks/main.yml:{find_name_line_number(model.networks, created_networks.pop())}",
+        )
+    context.result.add_result(test_passed)
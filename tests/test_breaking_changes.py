@@ -0,0 +1,225 @@
+# This script tests how breaking changes are found (see roles/breaking_changes/files/breaking_changes.py).
+#
+# Usage: python test_breaking_changes.py
+#
+# Needs git. Commits are made in a temporary repository and the state is kept in temporary directories,
+# so neither this repository nor the real state/ directory are touched.
+
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+dirname = os.path.dirname(os.path.realpath(__file__))
+
+PASS_TAG = "\033[92m[PASS]\033[0m "
+ERROR_TAG = "\033[91m[ERROR]\033[0m "
+
+
+def load_breaking_changes(repository_directory, state_directory):
+    # A copy of the script of its own, checking the temporary repository into the temporary state directory
+    spec = importlib.util.spec_from_file_location(
+        "breaking_changes", f"{dirname}/../roles/breaking_changes/files/breaking_changes.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.SCRIPT_DIRECTORY = repository_directory
+    module.STATE_DIRECTORY = state_directory
+    module.STATE_DATABASE_PATH = f"{state_directory}/application_state.db"
+    module.LEGACY_STATE_FILE_PATH = f"{state_directory}/application_last_run_hashes.csv"
+    module.COMMIT_INDEX_FILE_PATH = f"{state_directory}/breaking_changes_index.json"
+    return module
+
+
+def git(repository_directory, *args):
+    return (
+        subprocess.check_output(["git", *args], cwd=repository_directory, stderr=subprocess.DEVNULL)
+        .decode("utf-8")
+        .strip()
+    )
+
+
+def commit(repository_directory, subject):
+    git(repository_directory, "commit", "--allow-empty", "--quiet", "-m", subject)
+    return git(repository_directory, "rev-parse", "HEAD")
+
+
+def record_git_logs(breaking_changes):
+    # The last indexed commit of every git log the script reads
+    git_logs = []
+    read_git_log = breaking_changes.read_git_log
+
+    def recording_read_git_log(current_git_commit_hash, last_indexed_hash=None):
+        git_logs.append(last_indexed_hash)
+        return read_git_log(current_git_commit_hash, last_indexed_hash)
+
+    breaking_changes.read_git_log = recording_read_git_log
+    return git_logs
+
+
+def test_commit_index(repository_directory, state_directory):
+    # Map of test name -> whether it passed
+    results = dict()
+    breaking_changes = load_breaking_changes(repository_directory, state_directory)
+    git_logs = record_git_logs(breaking_changes)
+
+    first = commit(repository_directory, "feat: Initial commit")
+    sonarr_change = commit(repository_directory, "feat(Sonarr)!: Move the config directory")
+    radarr_change = commit(repository_directory, "fix(radarr): Update the image")
+    commit_index = breaking_changes.load_commit_index(radarr_change)
+    results["Every commit is indexed on the first run"] = commit_index["commits"] == [first, sonarr_change, radarr_change]
+    results["Breaking changes are indexed by their scope, in lowercase"] = [
+        [position, scope] for position, scope, _ in commit_index["breaking"]
+    ] == [[1, "sonarr"]]
+    results["The index is saved in the state directory"] = os.path.exists(breaking_changes.COMMIT_INDEX_FILE_PATH)
+
+    git_logs.clear()
+    commit_index = breaking_changes.load_commit_index(radarr_change)
+    results["Git isn't read again when HEAD is already indexed"] = git_logs == [] and len(commit_index["commits"]) == 3
+
+    git_logs.clear()
+    second_radarr_change = commit(repository_directory, "feat(RADARR)!: Rename the container")
+    commit_index = breaking_changes.load_commit_index(second_radarr_change)
+    results["Only commits since the indexed HEAD are read"] = git_logs == [radarr_change]
+    results["Commits keep their position when the index is extended"] = commit_index["commits"] == [
+        first,
+        sonarr_change,
+        radarr_change,
+        second_radarr_change,
+    ] and commit_index["parents"] == [[], [0], [1], [2]]
+    results["Breaking changes are found in mixed case scopes"] = [
+        [position, scope] for position, scope, _ in commit_index["breaking"]
+    ] == [[1, "sonarr"], [3, "radarr"]]
+
+    # Rewrite history from the Sonarr change on, so the indexed HEAD no longer exists
+    git(repository_directory, "reset", "--hard", "--quiet", sonarr_change)
+    rewritten = commit(repository_directory, "fix(radarr): Update the image again")
+    git(repository_directory, "reflog", "expire", "--expire=now", "--all")
+    git(repository_directory, "gc", "--prune=now", "--quiet")
+    git_logs.clear()
+    commit_index = breaking_changes.load_commit_index(rewritten)
+    results["The index is rebuilt when the indexed HEAD was rewritten away"] = git_logs == [
+        second_radarr_change,
+        None,
+    ] and commit_index["commits"] == [first, sonarr_change, rewritten]
+
+    # Application checks against the index, from the commit each one was last run at
+    connection = breaking_changes.open_state()
+    breaking_changes.set_last_hash(connection, "sonarr", first)
+    breaking_changes.set_last_hash(connection, "Radarr", first)
+    breaking_changes.set_last_hash(connection, "lidarr", first)
+    connection.execute("COMMIT")
+    connection.close()
+    checked_applications = breaking_changes.check_applications(["sonarr", "Radarr", "lidarr"])
+    results["Applications are checked against scopes whatever their case"] = checked_applications == {
+        "sonarr": True,
+        "Radarr": False,
+        "lidarr": False,
+    }
+    results["Breaking changes are written to the state directory"] = os.path.exists(
+        breaking_changes.get_breaking_change_file_path("sonarr")
+    )
+
+    return results
+
+
+def test_state(repository_directory, state_directory):
+    # Map of test name -> whether it passed
+    results = dict()
+    breaking_changes = load_breaking_changes(repository_directory, state_directory)
+    current = git(repository_directory, "rev-parse", "HEAD")
+    first = git(repository_directory, "rev-list", "--max-parents=0", "HEAD")
+
+    def get_last_hashes():
+        connection = breaking_changes.open_state()
+        try:
+            return dict(connection.execute("SELECT application, commit_hash FROM last_run_hashes"))
+        finally:
+            connection.close()
+
+    # State left by older versions of the script, next to a newer hash already in the database
+    with open(breaking_changes.LEGACY_STATE_FILE_PATH, "w") as f:
+        f.write(f"sonarr,{first}\nradarr,{first}\n")
+    connection = breaking_changes.open_state()
+    breaking_changes.set_last_hash(connection, "radarr", current)
+    connection.execute("COMMIT")
+    connection.close()
+
+    breaking_changes.check_applications(["lidarr"])
+    results["The legacy state file is migrated"] = get_last_hashes() == {
+        "sonarr": first,
+        "radarr": current,
+        "lidarr": current,
+    }
+    results["The legacy state file is renamed once migrated"] = not os.path.exists(
+        breaking_changes.LEGACY_STATE_FILE_PATH
+    ) and os.path.exists(breaking_changes.LEGACY_STATE_FILE_PATH + ".migrated")
+
+    connection = breaking_changes.open_state()
+    migrated = breaking_changes.migrate_legacy_state(connection)
+    connection.execute("ROLLBACK")
+    connection.close()
+    breaking_changes.check_applications(["lidarr"])
+    results["Nothing is migrated again once the legacy state file was"] = not migrated and get_last_hashes() == {
+        "sonarr": first,
+        "radarr": current,
+        "lidarr": current,
+    }
+
+    # A second writer opens the state while the first holds its lock
+    writes = []
+    second_writer_started = threading.Event()
+
+    def second_writer():
+        second_writer_started.set()
+        connection = breaking_changes.open_state()
+        writes.append("second")
+        breaking_changes.set_last_hash(connection, "radarr", first)
+        connection.execute("COMMIT")
+        connection.close()
+
+    connection = breaking_changes.open_state()
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    second_writer_started.wait()
+    time.sleep(0.5)
+    results["A second writer waits for the state's lock"] = thread.is_alive() and writes == []
+    writes.append("first")
+    breaking_changes.set_last_hash(connection, "sonarr", current)
+    connection.execute("COMMIT")
+    connection.close()
+    thread.join()
+    results["Writers update the state one after the other"] = writes == ["first", "second"]
+    results["Updates of both writers are kept"] = get_last_hashes() == {
+        "sonarr": current,
+        "radarr": first,
+        "lidarr": current,
+    }
+
+    return results
+
+
+def main():
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        repository_directory = f"{directory}/repository"
+        os.makedirs(repository_directory)
+        os.makedirs(f"{directory}/index_state")
+        os.makedirs(f"{directory}/state")
+        git(repository_directory, "init", "--quiet")
+        git(repository_directory, "config", "user.name", "Test")
+        git(repository_directory, "config", "user.email", "test@example.com")
+        results.update(test_commit_index(repository_directory, f"{directory}/index_state"))
+        results.update(test_state(repository_directory, f"{directory}/state"))
+
+    for name, passed in results.items():
+        print((PASS_TAG if passed else ERROR_TAG) + name)
+    if not all(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
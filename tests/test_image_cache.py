@@ -0,0 +1,97 @@
+# This script tests the cache that decides which images are pulled again (see action_plugins/docker_image_cache.py).
+#
+# Usage: python test_image_cache.py
+#
+# Needs Ansible, which the action plugin is written against. The cache is kept in a temporary database,
+# so the real state/ directory is never touched.
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+dirname = os.path.dirname(os.path.realpath(__file__))
+
+PASS_TAG = "\033[92m[PASS]\033[0m "
+ERROR_TAG = "\033[91m[ERROR]\033[0m "
+
+HOST = "server"
+SONARR_IMAGE = "linuxserver/sonarr:latest"
+RADARR_IMAGE = "linuxserver/radarr:latest"
+
+
+def load_image_cache():
+    spec = importlib.util.spec_from_file_location(
+        "docker_image_cache", f"{dirname}/../action_plugins/docker_image_cache.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_tests(image_cache, database_path):
+    # Map of test name -> whether it passed
+    results = dict()
+
+    def find_images_to_pull(host=HOST, max_age_hours=24, force=False):
+        connection = image_cache.open_state(database_path)
+        try:
+            return image_cache.find_images_to_pull(
+                connection, host, [SONARR_IMAGE, RADARR_IMAGE], max_age_hours, force
+            )
+        finally:
+            connection.close()
+
+    def record_pulled_images(pulled):
+        connection = image_cache.open_state(database_path)
+        try:
+            changed_images = image_cache.record_pulled_images(connection, HOST, pulled)
+            connection.execute("COMMIT")
+            return changed_images
+        finally:
+            connection.close()
+
+    results["Images that were never pulled are due"] = find_images_to_pull() == [SONARR_IMAGE, RADARR_IMAGE]
+
+    changed_images = record_pulled_images([f"{SONARR_IMAGE} sha256:1", f"{RADARR_IMAGE} sha256:2"])
+    results["Pulling an image for the first time changes it"] = changed_images == [SONARR_IMAGE, RADARR_IMAGE]
+    results["Images pulled within max_age_hours aren't due"] = find_images_to_pull() == []
+    results["Images are cached per host"] = find_images_to_pull(host="other") == [SONARR_IMAGE, RADARR_IMAGE]
+    results["Every image is due with force"] = find_images_to_pull(force=True) == [SONARR_IMAGE, RADARR_IMAGE]
+    results["Every image is due with a max_age_hours of 0"] = find_images_to_pull(max_age_hours=0) == [SONARR_IMAGE, RADARR_IMAGE]
+
+    changed_images = record_pulled_images([f"{SONARR_IMAGE} sha256:1", f"{RADARR_IMAGE} sha256:3"])
+    results["Only images that resolved to another digest change"] = changed_images == [RADARR_IMAGE]
+
+    # Age sonarr's pull past max_age_hours
+    connection = image_cache.open_state(database_path)
+    connection.execute(
+        "UPDATE image_digests SET pulled_at = ? WHERE image = ?",
+        (time.time() - 25 * 60 * 60, SONARR_IMAGE),
+    )
+    connection.execute("COMMIT")
+    connection.close()
+    results["Images pulled before max_age_hours are due again"] = find_images_to_pull() == [SONARR_IMAGE]
+
+    return results
+
+
+def main():
+    try:
+        image_cache = load_image_cache()
+    except ImportError as e:
+        print(ERROR_TAG + f"Can't load the image cache ({e}), install Ansible with `pip install ansible-core` first")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_tests(image_cache, f"{directory}/application_state.db")
+
+    for name, passed in results.items():
+        print((PASS_TAG if passed else ERROR_TAG) + name)
+    if not all(results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()